@@ -656,8 +656,8 @@ class Agent:
         if allow_nonunit_distance:
             assert from_y == to_y or from_x == to_x or \
                    abs(from_y - to_y) == abs(from_x - to_x), ((from_y, from_x), (to_y, to_x))
-            to_y = from_y + np.sign(to_y - from_y)
-            to_x = from_x + np.sign(to_x - from_x)
+            to_y = from_y + (to_y > from_y) - (to_y < from_y)
+            to_x = from_x + (to_x > from_x) - (to_x < from_x)
 
         assert abs(from_y - to_y) <= 1 and abs(from_x - to_x) <= 1, ((from_y, from_x), (to_y, to_x))
 
@@ -502,11 +502,13 @@ class Character:
         if launcher is not None:
             skill_hit_bonus, dmg_bonus = self._get_weapon_skill_bonus(launcher)
             roll_offset += skill_hit_bonus
-            roll_offset += launcher.get_weapon_bonus(large_monster)[0]
-            dmg_bonus += launcher.get_weapon_bonus(large_monster)[1]
+            to_hit, dmg = launcher.get_weapon_bonus(large_monster)
+            roll_offset += to_hit
+            dmg_bonus += dmg
 
-        roll_offset += ammo.get_weapon_bonus(large_monster)[0]
-        dmg_bonus += ammo.get_weapon_bonus(large_monster)[1]
+        to_hit, dmg = ammo.get_weapon_bonus(large_monster)
+        roll_offset += to_hit
+        dmg_bonus += dmg
 
         return roll_offset, max(0, dmg_bonus)
 
@@ -597,12 +599,13 @@ class Character:
         roll_offset += skill_hit_bonus
 
         if item is not None:
+            to_hit, dmg = item.get_weapon_bonus(large_monster)
             if item.is_launcher() or item.is_fired_projectile() or item.objs[0].name in ['dart', 'shuriken']:
                 # TODO: rocks, boomerang
                 dmg_bonus = 1.5  # 1d2
             else:
-                dmg_bonus += item.get_weapon_bonus(large_monster)[1]
-            roll_offset += item.get_weapon_bonus(large_monster)[0]
+                dmg_bonus += dmg
+            roll_offset += to_hit
         else:
             # TODO: proper unarmed base damage
             dmg_bonus += 1.5
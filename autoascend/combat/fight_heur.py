@@ -1,23 +1,31 @@
 from collections import defaultdict
 from itertools import product
 
+import nle.nethack as nh
 import numpy as np
 from scipy import signal
 
 from ..glyph import G
 from ..utils import adjacent
 from .monster_utils import is_monster_faster, is_dangerous_monster, \
-    ONLY_RANGED_SLOW_MONSTERS, EXPLODING_MONSTERS, WEAK_MONSTERS, consider_melee_only_ranged_if_hp_full
+    ONLY_RANGED_SLOW_MONSTERS, EXPLODING_MONSTERS, WEAK_MONSTERS, WEAK_OR_ONLY_RANGED_SLOW_MONSTERS, \
+    consider_melee_only_ranged_if_hp_full
 from .movement_priority import draw_monster_priority_positive, draw_monster_priority_negative
-from .utils import wielding_ranged_weapon, line_dis_from, inside
+from .utils import get_agent_state, line_dis_from, inside
 
+# glyph -> bool lookup tables for the line of fire checks
+_IS_PET = np.zeros(nh.MAX_GLYPH, dtype=bool)
+_IS_PET[list(G.PETS)] = True
+_IS_MON = np.zeros(nh.MAX_GLYPH, dtype=bool)
+_IS_MON[list(G.MONS)] = True
 
-def melee_monster_priority(agent, monsters, monster):
+
+def melee_monster_priority(agent, monsters, monster, state):
     _, y, x, mon, _ = monster
     ret = 1
-    if agent.blstats.hitpoints > 8 or is_monster_faster(agent, monster):
+    if state.hitpoints > 8 or is_monster_faster(agent, monster):
         ret += 15
-    if wielding_ranged_weapon(agent) and not is_monster_faster(agent, monster):
+    if state.wielding_ranged_weapon and not is_monster_faster(agent, monster):
         ret -= 6
     if mon.mname in EXPLODING_MONSTERS:
         ret -= 17
@@ -36,7 +44,7 @@ def melee_monster_priority(agent, monsters, monster):
     if mon.mname == 'gas spore':
         # handle a specific case when you are trapped by a gas spore
         if len(agent.get_visible_monsters()) == 1 \
-                and agent.blstats.hitpoints / agent.blstats.max_hitpoints:
+                and state.hitpoints / state.max_hitpoints:
             dis = agent.bfs()
             for y2, x2 in zip(*np.nonzero(dis != -1)):
                 if not adjacent((y, x), (y2, x2)):
@@ -54,7 +62,7 @@ def ranged_priority(agent, dy, dx, monsters):
     for monster in monsters:
         _, my, mx, mon, _ = monster
         assert my != agent.blstats.y or mx != agent.blstats.x
-        if mon.mname not in WEAK_MONSTERS + ONLY_RANGED_SLOW_MONSTERS:
+        if mon.mname not in WEAK_OR_ONLY_RANGED_SLOW_MONSTERS:
             closest_mon_dis = min(closest_mon_dis, line_dis_from(agent, my, mx))
 
     if closest_mon_dis == 1:
@@ -67,37 +75,43 @@ def ranged_priority(agent, dy, dx, monsters):
     if launcher is not None and not launcher.equipped:
         ret -= 5
 
+    # the whole ray up to the map border, checked at once
+    glyphs = agent.glyphs
     y, x = agent.blstats.y, agent.blstats.x
-    while True:
-        y += dy
-        x += dx
-        if not 0 <= y < agent.glyphs.shape[0] or not 0 <= x < agent.glyphs.shape[1]:
-            return None
-
-        if agent.glyphs[y, x] in G.PETS or not agent.current_level().walkable[y, x]:
-            return None
-
-        if agent.glyphs[y, x] in G.MONS:
-            monster = [m for m in monsters if m[1] == y and m[2] == x]
-            if not monster:
-                # there is a monster that shouldn't be attacked
-                return None
-            assert len(monster) == 1
-            _, _, _, mon, _ = monster[0]
-            dis = line_dis_from(agent, y, x)
-            if dis > agent.character.get_range(launcher, ammo):
-                return None
-            if dis in (1, 2):
-                ret -= 5
-            if dis == 1:
-                ret -= 6
-                if mon.mname == 'gas spore':  # only gas spore ?
-                    ret -= 100
-            return ret, y, x, monster[0]
+    h, w = glyphs.shape
+    length = min(h - 1 - y if dy > 0 else y if dy < 0 else w,
+                 w - 1 - x if dx > 0 else x if dx < 0 else h)
+    steps = np.arange(1, length + 1)
+    ys = y + dy * steps
+    xs = x + dx * steps
+    ray = glyphs[ys, xs]
+    blocked = _IS_PET[ray] | ~agent.current_level().walkable[ys, xs]
+    stops = np.flatnonzero(blocked | _IS_MON[ray])
+    if not stops.size or blocked[stops[0]]:
+        return None
+
+    y, x = int(ys[stops[0]]), int(xs[stops[0]])
+    monster = [m for m in monsters if m[1] == y and m[2] == x]
+    if not monster:
+        # there is a monster that shouldn't be attacked
+        return None
+    assert len(monster) == 1
+    _, _, _, mon, _ = monster[0]
+    dis = line_dis_from(agent, y, x)
+    if dis > agent.character.get_range(launcher, ammo):
+        return None
+    if dis in (1, 2):
+        ret -= 5
+    if dis == 1:
+        ret -= 6
+        if mon.mname == 'gas spore':  # only gas spore ?
+            ret -= 100
+    return ret, y, x, monster[0]
 
 
 def get_next_states(agent, wand, y, x, dy, dx):
-    if not inside(agent, y, x) or not agent.current_level().walkable[y, x]:
+    walkable = agent.current_level().walkable
+    if not inside(agent, y, x) or not walkable[y, x]:
         can_bounce = wand.is_ray_wand()
         if not can_bounce:
             return []
@@ -106,8 +120,8 @@ def get_next_states(agent, wand, y, x, dy, dx):
         # TODO: diagonal
         side1 = (y, x - dx)
         side2 = (y - dy, x)
-        side1_wall = not inside(agent, *side1) or not agent.current_level().walkable[side1]
-        side2_wall = not inside(agent, *side2) or not agent.current_level().walkable[side2]
+        side1_wall = not inside(agent, *side1) or not walkable[side1]
+        side2_wall = not inside(agent, *side2) or not walkable[side2]
         dy1, dx1 = side2[0] - side1[0], side2[1] - side1[1]
         dy2, dx2 = side1[0] - side2[0], side1[1] - side2[1]
         if side1_wall and side2_wall:
@@ -204,11 +218,12 @@ def elbereth_action(agent, monsters):
     if not agent.can_engrave():
         return []
     adj_monsters_count = 0
+    ay, ax = agent.blstats.y, agent.blstats.x
     for monster in monsters:
         _, my, mx, mon, _ = monster
         if mon.mname in ONLY_RANGED_SLOW_MONSTERS:
             continue
-        if not adjacent((my, mx), (agent.blstats.y, agent.blstats.x)):
+        if max(abs(my - ay), abs(mx - ax)) != 1:
             continue
         multiplier = np.clip(20 / agent.blstats.hitpoints, 1.0, 1.5)
         if is_monster_faster(agent, monster):
@@ -234,29 +249,35 @@ def wait_action(agent, monsters):
     return []
 
 
-def get_available_actions(agent, monsters):
+def get_available_actions(agent, monsters, state):
     actions = []
+    on_elbereth = agent.inventory.engraving_below_me.lower() == 'elbereth'
 
     # melee attack actions
-    for monster in monsters:
-        _, y, x, mon, _ = monster
-        if adjacent((y, x), (agent.blstats.y, agent.blstats.x)):
-            priority = melee_monster_priority(agent, monsters, monster)
-            if agent.inventory.engraving_below_me.lower() == 'elbereth':
+    if monsters:
+        ys = np.array([m[1] for m in monsters])
+        xs = np.array([m[2] for m in monsters])
+        adjacent_mask = np.maximum(np.abs(ys - agent.blstats.y), np.abs(xs - agent.blstats.x)) == 1
+        for i in np.flatnonzero(adjacent_mask):
+            monster = monsters[i]
+            _, y, x, mon, _ = monster
+            priority = melee_monster_priority(agent, monsters, monster, state)
+            if on_elbereth:
                 priority -= 100
             dy = y - agent.blstats.y
             dx = x - agent.blstats.x
             actions.append((priority, ('melee', dy, dx)))
 
     # ranged attack actions
+    only_ranged_slow = all(monster[3].mname in ONLY_RANGED_SLOW_MONSTERS for monster in monsters)
     for dy, dx in product([-1, 0, 1], [-1, 0, 1]):
         if dy != 0 or dx != 0:
             ranged_pr = ranged_priority(agent, dy, dx, monsters)
             if ranged_pr is not None:
                 pri, y, x, monster = ranged_pr
-                if agent.inventory.engraving_below_me.lower() == 'elbereth':
+                if on_elbereth:
                     pri -= 100
-                if all(monster[3].mname in ONLY_RANGED_SLOW_MONSTERS for monster in monsters):
+                if only_ranged_slow:
                     pri += 10
                 actions.append((pri, ('ranged', dy, dx)))
 
@@ -296,9 +317,10 @@ def goto_action(agent, priority, monsters):
         return []
 
     assert monsters
+    ay, ax = agent.blstats.y, agent.blstats.x
     for monster in monsters:
         _, my, mx, mon, _ = monster
-        if not adjacent((agent.blstats.y, agent.blstats.x), (my, mx)):
+        if max(abs(my - ay), abs(mx - ax)) != 1:
             # and not mon.mname in ONLY_RANGED_SLOW_MONSTERS:
             return [(1, ('go_to', my, mx))]
     assert 0, monsters
@@ -313,15 +335,35 @@ def get_corridors_priority_map(walkable):
     return corridor_mask + corridor_dilated >= 1
 
 
+def _priority_buffers(agent, shape):
+    """ Returns the zeroed (priority, negative priority) maps, reused between calls.
+    The heatmap returned by `get_priorities` is only valid until the next call """
+    buffers = getattr(agent, '_fight2_priority_buffers', None)
+    if buffers is None or buffers[0].shape != shape:
+        buffers = agent._fight2_priority_buffers = (np.empty(shape, dtype=float), np.empty(shape, dtype=float))
+    for buffer in buffers:
+        buffer.fill(0)
+    return buffers
+
+
 def get_priorities(agent):
     """ Returns a pair (move priority heatmap, other actions (with priorities) list) """
     walkable = agent.current_level().walkable
-    priority = np.zeros(walkable.shape, dtype=float)
     monsters = agent.get_visible_monsters()
+    if not monsters:
+        # nothing to draw, and `goto_action` needs a monster to go to
+        priority = np.where(walkable, 0.0, float('nan'))
+        priority -= priority[agent.blstats.y, agent.blstats.x]
+        return priority, []
+
+    priority, negative = _priority_buffers(agent, walkable.shape)
+    state = get_agent_state(agent)
+    # negative draws are purely additive and must land after all the positive (max) ones,
+    # so they are accumulated separately in the same pass
     for m in monsters:
-        draw_monster_priority_positive(agent, m, priority, walkable)
-    for m in monsters:
-        draw_monster_priority_negative(agent, m, priority, walkable)
+        draw_monster_priority_positive(agent, m, priority, walkable, state)
+        draw_monster_priority_negative(agent, m, negative, walkable, state)
+    priority += negative
     priority[~walkable] = float('nan')
 
     # TODO: figure out how to use corridors priority so that it improves the score
@@ -335,7 +377,7 @@ def get_priorities(agent):
     # use relative priority to te current position
     priority -= priority[agent.blstats.y, agent.blstats.x]
 
-    actions = get_available_actions(agent, monsters)
+    actions = get_available_actions(agent, monsters, state)
     if not any(a[1][0] in ('melee', 'ranged') for a in actions):
         actions.extend(goto_action(agent, priority, monsters))
     return priority, actions
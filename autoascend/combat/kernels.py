@@ -0,0 +1,76 @@
+import numba as nb
+
+
+@nb.njit('void(f8[:,:],i8,i8,f8,i8)', cache=True)
+def draw_around_add(priority, y, x, value, radius):
+    # only the square perimeter is visited: rows (with corners) and then columns (without corners)
+    h, w = priority.shape
+    x0, x1 = max(x - radius, 0), min(x + radius + 1, w)
+    y0, y1 = max(y - radius + 1, 0), min(y + radius, h)
+    if y - radius >= 0:
+        for x2 in range(x0, x1):
+            priority[y - radius, x2] += value
+    if radius > 0 and y + radius < h:
+        for x2 in range(x0, x1):
+            priority[y + radius, x2] += value
+    if x - radius >= 0:
+        for y2 in range(y0, y1):
+            priority[y2, x - radius] += value
+    if radius > 0 and x + radius < w:
+        for y2 in range(y0, y1):
+            priority[y2, x + radius] += value
+
+
+@nb.njit('void(f8[:,:],i8,i8,f8,i8)', cache=True)
+def draw_around_max(priority, y, x, value, radius):
+    # `value > priority[...]` is the same as python `max(priority[...], value)` (nan is kept)
+    h, w = priority.shape
+    x0, x1 = max(x - radius, 0), min(x + radius + 1, w)
+    y0, y1 = max(y - radius + 1, 0), min(y + radius, h)
+    if y - radius >= 0:
+        for x2 in range(x0, x1):
+            if value > priority[y - radius, x2]:
+                priority[y - radius, x2] = value
+    if radius > 0 and y + radius < h:
+        for x2 in range(x0, x1):
+            if value > priority[y + radius, x2]:
+                priority[y + radius, x2] = value
+    if x - radius >= 0:
+        for y2 in range(y0, y1):
+            if value > priority[y2, x - radius]:
+                priority[y2, x - radius] = value
+    if radius > 0 and x + radius < w:
+        for y2 in range(y0, y1):
+            if value > priority[y2, x + radius]:
+                priority[y2, x + radius] = value
+
+
+@nb.njit('void(f8[:,:],i8,i8,f8,b1[:,:],i8)', cache=True)
+def draw_ranged_add(priority, y, x, value, walkable, radius):
+    for direction_y in range(-1, 2):
+        for direction_x in range(-1, 2):
+            if direction_y == 0 and direction_x == 0:
+                continue
+            for i in range(1, radius + 1):
+                y1 = y + direction_y * i
+                x1 = x + direction_x * i
+                if 0 <= y1 < priority.shape[0] and 0 <= x1 < priority.shape[1]:
+                    if not walkable[y1, x1]:
+                        break
+                    priority[y1, x1] += value
+
+
+@nb.njit('void(f8[:,:],i8,i8,f8,b1[:,:],i8)', cache=True)
+def draw_ranged_max(priority, y, x, value, walkable, radius):
+    for direction_y in range(-1, 2):
+        for direction_x in range(-1, 2):
+            if direction_y == 0 and direction_x == 0:
+                continue
+            for i in range(1, radius + 1):
+                y1 = y + direction_y * i
+                x1 = x + direction_x * i
+                if 0 <= y1 < priority.shape[0] and 0 <= x1 < priority.shape[1]:
+                    if not walkable[y1, x1]:
+                        break
+                    if value > priority[y1, x1]:
+                        priority[y1, x1] = value
@@ -1,17 +1,20 @@
+import re
+
 # heuristic monster types lists
-ONLY_RANGED_SLOW_MONSTERS = ['floating eye', 'blue jelly', 'brown mold', 'gas spore', 'acid blob']
-EXPLODING_MONSTERS = ['yellow light', 'gas spore', 'flaming sphere', 'freezing sphere', 'shocking sphere']
-INSECTS = ['giant ant', 'killer bee', 'soldier ant', 'fire ant', 'giant beetle', 'queen bee']
-WEAK_MONSTERS = ['lichen', 'newt', 'shrieker', 'grid bug']
-WEIRD_MONSTERS = ['leprechaun', 'nymph']
+ONLY_RANGED_SLOW_MONSTERS = frozenset({'floating eye', 'blue jelly', 'brown mold', 'gas spore', 'acid blob'})
+EXPLODING_MONSTERS = frozenset({'yellow light', 'gas spore', 'flaming sphere', 'freezing sphere', 'shocking sphere'})
+INSECTS = frozenset({'giant ant', 'killer bee', 'soldier ant', 'fire ant', 'giant beetle', 'queen bee'})
+WEAK_MONSTERS = frozenset({'lichen', 'newt', 'shrieker', 'grid bug'})
+WEIRD_MONSTERS = frozenset({'leprechaun', 'nymph'})
+WEAK_OR_ONLY_RANGED_SLOW_MONSTERS = WEAK_MONSTERS | ONLY_RANGED_SLOW_MONSTERS
+
+FASTER_MONSTERS_RE = re.compile('bat|dog|cat|kitten|pony|horse|bee|fox')
 
 
 def is_monster_faster(agent, monster):
     _, y, x, mon, _ = monster
     # TOOD: implement properly
-    return 'bat' in mon.mname or 'dog' in mon.mname or 'cat' in mon.mname \
-           or 'kitten' in mon.mname or 'pony' in mon.mname or 'horse' in mon.mname \
-           or 'bee' in mon.mname or 'fox' in mon.mname
+    return FASTER_MONSTERS_RE.search(mon.mname) is not None
 
 
 def imminent_death_on_melee(agent, monster):
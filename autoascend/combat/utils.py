@@ -1,15 +1,23 @@
+from collections import namedtuple
+
+# agent properties used by the per-monster heuristics, computed once per `get_priorities` call
+AgentState = namedtuple('AgentState', 'hitpoints,max_hitpoints,has_ranged_combinations,wielding_ranged_weapon')
+
+
 def wielding_ranged_weapon(agent):
-    for item in agent.inventory.items:
-        if item.is_launcher() and item.equipped:
-            return True
-    return False
+    # every equipped weapon is indexed as the main hand item
+    main_hand = agent.inventory.items.main_hand
+    return main_hand is not None and main_hand.is_launcher()
 
 
 def wielding_melee_weapon(agent):
-    for item in agent.inventory.items:
-        if item.is_weapon() and item.equipped:
-            return True
-    return False
+    main_hand = agent.inventory.items.main_hand
+    return main_hand is not None and main_hand.is_weapon()
+
+
+def get_agent_state(agent):
+    return AgentState(agent.blstats.hitpoints, agent.blstats.max_hitpoints,
+                      bool(agent.inventory.get_ranged_combinations()), wielding_ranged_weapon(agent))
 
 
 def line_dis_from(agent, y, x):
@@ -1,37 +1,118 @@
 import atexit
 import contextlib
+import ctypes
+import fcntl
+import functools
 import gc
 import multiprocessing
 import os
+import select
+import selectors
 import shutil
+import subprocess
 import sys
 import tempfile
 import termios
+import time
 import tty
+from collections import deque
 from pathlib import Path
 from pprint import pprint
 
 import nle.nethack as nh
+import numpy as np
 
 from autoascend.visualization import visualizer
 from autoascend import agent as agent_lib  # the library can be reloaded in `reload_agent` function
 
 
+FICLONE = 0x40049409
+
+
+def _reflink_tree(src, dst):
+    # copy-on-write clone of the directory (metadata only on btrfs/xfs/apfs), falls back to a regular copy
+    if sys.platform == 'linux':
+        try:
+            for root, _, files in os.walk(src):
+                target = os.path.join(dst, os.path.relpath(root, src))
+                os.makedirs(target, exist_ok=True)
+                for name in files:
+                    with open(os.path.join(root, name), 'rb') as fsrc, \
+                            open(os.path.join(target, name), 'wb') as fdst:
+                        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                    shutil.copymode(os.path.join(root, name), os.path.join(target, name))
+            return
+        except OSError:
+            pass
+    elif sys.platform == 'darwin':
+        with contextlib.suppress(OSError):
+            os.rmdir(dst)  # clonefile requires the destination not to exist
+        libc = ctypes.CDLL('libSystem.dylib', use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) == 0:
+            return
+
+    os.makedirs(dst, exist_ok=True)
+    try:
+        subprocess.run(['cp', '-a', '--reflink=auto', os.path.join(src, '.'), dst],
+                       check=True, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        shutil.copytree(src, dst, dirs_exist_ok=True)
+
+
 def fork_with_nethack_env(env):
-    tmpdir = tempfile.mkdtemp(prefix='nlecopy_')
-    shutil.copytree(env.env._vardir, tmpdir, dirs_exist_ok=True)
+    # a separate copy for the parent and the child, so after the fork each one only moves its own directory
+    tmpdirs = [tempfile.mkdtemp(prefix='nlecopy_') for _ in range(2)]
+    for tmpdir in tmpdirs:
+        _reflink_tree(env.env._vardir, tmpdir)
     env.env._tempdir = None  # it has to be done before the fork to avoid removing the same directory two times
     gc.collect()
-
+    # the child continues with the in-memory agent state, so a real fork is needed (no exec / shared VM).
+    # The child freezes everything it inherited before any collection could run, so it won't touch (and copy)
+    # inherited pages. The parent keeps its GC state untouched
     pid = os.fork()
+    if pid == 0:
+        gc.freeze()
 
+    tmpdir = tmpdirs[pid == 0]
     env.env._tempdir = tempfile.TemporaryDirectory(prefix='nlefork_')
-    shutil.copytree(tmpdir, env.env._tempdir.name, dirs_exist_ok=True)
+    if os.stat(tmpdir).st_dev == os.stat(env.env._tempdir.name).st_dev:
+        os.rename(tmpdir, env.env._tempdir.name)  # replaces the empty directory, no data is copied
+    else:
+        _reflink_tree(tmpdir, env.env._tempdir.name)
+        shutil.rmtree(tmpdir, ignore_errors=True)
     env.env._vardir = env.env._tempdir.name
     os.chdir(env.env._vardir)
     return pid
 
 
+def _wait_for_child(pid):
+    # Ctrl-C is meant for the child, so the parent ignores it while waiting
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):  # python < 3.9 or linux < 5.3
+        pidfd = None
+
+    if pidfd is None:
+        while 1:
+            try:
+                os.waitpid(pid, 0)
+                return
+            except KeyboardInterrupt:
+                pass
+
+    # stdin is not in the select set -- it belongs to the child
+    try:
+        while 1:
+            try:
+                if select.select([pidfd], [], [])[0]:
+                    break
+            except KeyboardInterrupt:
+                pass
+        os.waitpid(pid, 0)
+    finally:
+        os.close(pidfd)
+
+
 def reload_agent(base_path=str(Path(__file__).parent.absolute())):
     global visualize, agent_lib
     visualize = agent_lib = None
@@ -55,6 +136,50 @@ def reload_agent(base_path=str(Path(__file__).parent.absolute())):
                        {k: sys.getrefcount(sys.modules[k]) for k in modules_to_remove})
 
 
+@functools.lru_cache(1)
+def glyph_descriptions():
+    # list indexed by glyph: (glyph class name, description), used by `EnvWrapper.print_help`
+    obj_classes = {getattr(nh, x): x for x in dir(nh) if x.endswith('_CLASS')}
+    glyph_classes = sorted((getattr(nh, x), x) for x in dir(nh) if x.endswith('_OFF'))
+
+    ret = []
+    for i in range(nh.MAX_GLYPH):
+        desc = ''
+        if glyph_classes and i == glyph_classes[0][0]:
+            cls = glyph_classes.pop(0)[1]
+
+        if nh.glyph_is_monster(i):
+            desc = f': "{nh.permonst(nh.glyph_to_mon(i)).mname}"'
+
+        if nh.glyph_is_normal_object(i):
+            obj = nh.objclass(nh.glyph_to_obj(i))
+            appearance = nh.OBJ_DESCR(obj) or nh.OBJ_NAME(obj)
+            oclass = ord(obj.oc_class)
+            desc = f': {obj_classes[oclass]}: "{appearance}"'
+
+        ret.append((cls.replace('_OFF', ''), desc))
+    return ret
+
+
+def _split_keys(data):
+    # splits a burst of terminal input into single keys (escape sequences are kept together)
+    keys = []
+    i = 0
+    while i < len(data):
+        j = i + 1
+        if data[i] == 0x1b and j < len(data):
+            if data[j] == ord('O'):
+                j = min(j + 2, len(data))
+            elif data[j] == ord('['):
+                j += 1
+                while j < len(data) and not 0x40 <= data[j] <= 0x7e:
+                    j += 1
+                j = min(j + 1, len(data))
+        keys.append(data[i:j])
+        i = j
+    return keys
+
+
 class ReloadAgent(KeyboardInterrupt):
     # it inherits from KeyboardInterrupt as the agent doesn't catch that exception
     pass
@@ -64,6 +189,11 @@ class EnvWrapper:
     def __init__(self, env, to_skip=0, visualizer_args=dict(enable=False),
                  step_limit=None, agent_args={}, interactive=False):
         self.env = env
+        self._action_to_index = {}
+        self._key_to_actions = {}
+        for i, a in enumerate(env._actions):
+            self._action_to_index.setdefault(int(a), i)
+            self._key_to_actions.setdefault(int(a), []).append(a)
         self.agent_args = agent_args
         self.interactive = interactive
         self.to_skip = to_skip
@@ -81,6 +211,12 @@ class EnvWrapper:
 
         self.is_done = False
 
+        self._stdin_selector = None
+        self._pending_keys = deque()
+        self._debug_tiles_cache = {}
+        self._last_render_time = 0.0
+        self._render_min_interval = 1 / 30 if interactive else 1 / 5
+
     def _init_agent(self):
         self.agent = agent_lib.Agent(self, **self.agent_args)
 
@@ -123,13 +259,10 @@ class EnvWrapper:
             pid = fork_with_nethack_env(self.env)
             if pid != 0:
                 # parent
+                # keys read ahead before the fork are consumed by the child, don't replay them here
+                self._pending_keys.clear()
                 print('freezing parent')
-                while 1:
-                    try:
-                        os.waitpid(pid, 0)
-                        break
-                    except KeyboardInterrupt:
-                        pass
+                _wait_for_child(pid)
                 self.visualizer.force_next_frame()
                 self.visualizer.render()
                 while 1:
@@ -155,21 +288,31 @@ class EnvWrapper:
 
     def render(self, force=False):
         if self.visualizer is not None:
-            with self.debug_tiles(self.agent.current_level().walkable, color=(0, 255, 0, 128)) \
-                    if self.draw_walkable else contextlib.suppress():
-                with self.debug_tiles(~self.agent.current_level().seen, color=(255, 0, 0, 128)) \
-                        if self.draw_seen else contextlib.suppress():
-                    with self.debug_tiles(self.agent.current_level().shop, color=(0, 0, 255, 64)) \
-                            if self.draw_shop else contextlib.suppress():
-                        with self.debug_tiles(self.agent.current_level().shop_interior, color=(0, 0, 255, 64)) \
-                                if self.draw_shop else contextlib.suppress():
-                            with self.debug_tiles((self.last_observation['specials'] & nh.MG_OBJPILE) > 0,
-                                                  color=(0, 255, 255, 128)):
-                                with self.debug_tiles([self.agent.cursor_pos],
-                                                      color=(255, 255, 255, 128)):
-                                    if force:
-                                        self.visualizer.force_next_frame()
-                                    rendered = self.visualizer.render()
+            if not force and not self.visualizer.will_render_now():
+                # no frame will be drawn, so skip preparing the overlays (only advance the frame skipping state)
+                self.visualizer.render()
+                return
+
+            # blstats may not be parsed yet (first render), so the level is fetched only when needed
+            level = self.agent.current_level() if self.draw_walkable or self.draw_seen or self.draw_shop else None
+            obj_piles = (self.last_observation['specials'] & nh.MG_OBJPILE) > 0
+
+            overlays = []
+            if self.draw_walkable:
+                overlays.append(self._cached_debug_tiles('walkable', level.walkable, color=(0, 255, 0, 128)))
+            if self.draw_seen:
+                overlays.append(self._cached_debug_tiles('unseen', ~level.seen, color=(255, 0, 0, 128)))
+            if self.draw_shop:
+                overlays.append(self._cached_debug_tiles('shop', level.shop, color=(0, 0, 255, 64)))
+                overlays.append(self._cached_debug_tiles('shop_interior', level.shop_interior,
+                                                         color=(0, 0, 255, 64)))
+            overlays.append(self._cached_debug_tiles('objpile', obj_piles, color=(0, 255, 255, 128)))
+            overlays.append(self.visualizer.debug_tiles([self.agent.cursor_pos], color=(255, 255, 255, 128)))
+
+            with self.visualizer.with_overlays(overlays):
+                if force:
+                    self.visualizer.force_next_frame()
+                rendered = self.visualizer.render()
 
             if not force and (not self.interactive or not rendered):
                 return
@@ -198,61 +341,61 @@ class EnvWrapper:
             print()
 
     def print_help(self):
-        scene_glyphs = set(self.env.last_observation[0].reshape(-1))
-        obj_classes = {getattr(nh, x): x for x in dir(nh) if x.endswith('_CLASS')}
-        glyph_classes = sorted((getattr(nh, x), x) for x in dir(nh) if x.endswith('_OFF'))
+        glyphs = self.env.last_observation[0].reshape(-1)
+        chars = self.env.last_observation[1].reshape(-1)
+        scene_glyphs, first_pos, counts = np.unique(glyphs, return_index=True, return_counts=True)
 
+        descriptions = glyph_descriptions()
         texts = []
-        for i in range(nh.MAX_GLYPH):
-            desc = ''
-            if glyph_classes and i == glyph_classes[0][0]:
-                cls = glyph_classes.pop(0)[1]
-
-            if nh.glyph_is_monster(i):
-                desc = f': "{nh.permonst(nh.glyph_to_mon(i)).mname}"'
-
-            if nh.glyph_is_normal_object(i):
-                obj = nh.objclass(nh.glyph_to_obj(i))
-                appearance = nh.OBJ_DESCR(obj) or nh.OBJ_NAME(obj)
-                oclass = ord(obj.oc_class)
-                desc = f': {obj_classes[oclass]}: "{appearance}"'
+        for i, pos, count in zip(scene_glyphs.tolist(), first_pos.tolist(), counts.tolist()):
+            if i >= len(descriptions):
+                continue
+            cls, desc = descriptions[i]
 
             desc2 = 'Labels: '
             if i in agent_lib.G.INV_DICT:
                 desc2 += ','.join(agent_lib.G.INV_DICT[i])
 
-            if i in scene_glyphs:
-                pos = (self.env.last_observation[0].reshape(-1) == i).nonzero()[0]
-                count = len(pos)
-                pos = pos[0]
-                char = bytes([self.env.last_observation[1].reshape(-1)[pos]])
-                texts.append((-count, f'{" " if i in agent_lib.G.INV_DICT else "U"} Glyph {i:4d} -> '
-                                      f'Char: {char} Count: {count:4d} '
-                                      f'Type: {cls.replace("_OFF", ""):11s} {desc:30s} '
-                                      f'{agent_lib.ALL.find(i) if agent_lib.ALL.find(i) is not None else "":20} '
-                                      f'{desc2}'))
+            char = bytes([chars[pos]])
+            texts.append((-count, f'{" " if i in agent_lib.G.INV_DICT else "U"} Glyph {i:4d} -> '
+                                  f'Char: {char} Count: {count:4d} '
+                                  f'Type: {cls:11s} {desc:30s} '
+                                  f'{agent_lib.ALL.find(i) if agent_lib.ALL.find(i) is not None else "":20} '
+                                  f'{desc2}'))
         for _, t in sorted(texts):
             print(t)
 
+    def _read_key(self):
+        if not self._pending_keys:
+            if self._stdin_selector is None:
+                self._stdin_selector = selectors.DefaultSelector()
+                self._stdin_selector.register(sys.stdin, selectors.EVENT_READ)
+            self._stdin_selector.select(timeout=None)
+            self._pending_keys.extend(_split_keys(os.read(sys.stdin.fileno(), 4096)))
+        return self._pending_keys.popleft()
+
+    def _render_unless_keys_pending(self):
+        # held down / pasted keys are handled without rendering intermediate frames
+        if not self._pending_keys:
+            self.visualizer.force_next_frame()
+            self.render()
+
     def get_action(self):
         while 1:
-            key = os.read(sys.stdin.fileno(), 5)
+            key = self._read_key()
 
             if key == b'\x1bOP':  # F1
                 self.draw_walkable = not self.draw_walkable
-                self.visualizer.force_next_frame()
-                self.render()
+                self._render_unless_keys_pending()
                 continue
             elif key == b'\x1bOQ':  # F2
                 self.draw_seen = not self.draw_seen
-                self.visualizer.force_next_frame()
-                self.render()
+                self._render_unless_keys_pending()
                 continue
 
             elif key == b'\x1bOR':  # F3
                 self.draw_shop = not self.draw_shop
-                self.visualizer.force_next_frame()
-                self.render()
+                self._render_unless_keys_pending()
                 continue
 
             if key == b'\x1bOS':  # F4
@@ -280,22 +423,26 @@ class EnvWrapper:
                 self.visualizer.force_next_frame()
                 return None
             else:
-                actions = [a for a in self.env._actions if int(a) == key]
+                actions = self._key_to_actions.get(key, [])
                 assert len(actions) < 2
                 if len(actions) == 0:
                     print('wrong key', key)
                     continue
 
-                action = actions[0]
-                return action
+                return actions[0]
 
     def step(self, agent_action):
         if self.visualizer is not None and self.visualizer.video_writer is None:
             self.visualizer.step(self.last_observation, repr(chr(int(agent_action))))
 
-            if self.interactive and self.to_skip <= 1:
+            force_frame = self.interactive and self.to_skip <= 1
+            if force_frame:
                 self.visualizer.force_next_frame()
-            self.render()
+            # with dynamic frame skipping frames can be dropped anyway, so don't render more often than needed
+            if force_frame or self.visualizer.frame_skipping is not None or \
+                    time.monotonic() - self._last_render_time >= self._render_min_interval:
+                self.render()
+                self._last_render_time = time.monotonic()
 
             if self.interactive:
                 print()
@@ -319,7 +466,7 @@ class EnvWrapper:
                 self.visualizer.step(self.last_observation, repr(chr(int(agent_action))))
             action = agent_action
 
-        obs, reward, done, info = self.env.step(self.env._actions.index(action))
+        obs, reward, done, info = self.env.step(self._action_to_index[int(action)])
         self.score += reward
         self.step_count += 1
         # if not done:
@@ -333,7 +480,8 @@ class EnvWrapper:
             if self.visualizer is not None:
                 self.visualizer.step(self.last_observation, repr(chr(int(agent_action))))
 
-            end_reason = bytes(obs['tty_chars'].reshape(-1)).decode().replace('You made the top ten list!', '').split()
+            end_reason = obs['tty_chars'].tobytes().decode('ascii', 'ignore') \
+                .replace('You made the top ten list!', '').split()
             if end_reason[7].startswith('Agent'):
                 self.score = int(end_reason[6])
                 end_reason = ' '.join(end_reason[8:-2])
@@ -362,6 +510,15 @@ class EnvWrapper:
 
         return obs, reward, done, info
 
+    def _cached_debug_tiles(self, name, tiles, color):
+        # reuse the scope (and its extracted tile list) as long as the overlay mask doesn't change between frames
+        cached = self._debug_tiles_cache.get(name)
+        if cached is not None and cached[1] == color and np.array_equal(cached[0], tiles):
+            return cached[2]
+        scope = self.debug_tiles(tiles, color=color)
+        self._debug_tiles_cache[name] = (tiles.copy(), color, scope)
+        return scope
+
     def debug_tiles(self, *args, **kwargs):
         if self.visualizer is not None:
             return self.visualizer.debug_tiles(*args, **kwargs)
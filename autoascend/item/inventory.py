@@ -14,8 +14,13 @@ from autoascend.glyph import G
 from autoascend.item import ItemManager, Item, ContainerContent, check_if_triggered_container_trap, \
     find_equivalent_item, flatten_items
 from autoascend.item.inventory_items import InventoryItems
+from autoascend.item.kernels import pickup_candidates
 from autoascend.strategy import Strategy
 
+WIELD_MESSAGE_RE = re.compile(r'(You secure the tether\.  )?([a-zA-z] - |welds?( itself| themselves| ) to|'
+                              r'You are already wielding that|You are empty handed|You are already empty handed)')
+SEVERAL_OBJECTS_HERE_RE = re.compile(r'There are (several|many) objects here\.')
+
 
 class Inventory:
     _name_to_category = {
@@ -84,9 +89,13 @@ class Inventory:
         old_letters_below_me = self.letters_below_me
 
         def f(self):
+            if self.items_below_me is old_items_below_me and self.letters_below_me is old_letters_below_me:
+                return
             if (
-                    [(l, i.text) for i, l in zip(old_items_below_me, old_letters_below_me)] !=
-                    [(l, i.text) for i, l in zip(self.items_below_me, self.letters_below_me)]
+                    len(old_items_below_me) != len(self.items_below_me) or
+                    any(ol != l or oi.text != i.text
+                        for oi, ol, i, l in zip(old_items_below_me, old_letters_below_me,
+                                                self.items_below_me, self.letters_below_me))
             ):
                 raise AgentPanic('items below me changed')
 
@@ -133,9 +142,7 @@ class Inventory:
                     'You cannot wield a two-handed weapon while wearing a shield.' in self.agent.message or \
                     ' welded to your hand' in self.agent.message:
                 return False
-            assert re.search(r'(You secure the tether\.  )?([a-zA-z] - |welds?( itself| themselves| ) to|'
-                             r'You are already wielding that|You are empty handed|You are already empty handed)', \
-                             self.agent.message), (self.agent.message, self.agent.popup)
+            assert WIELD_MESSAGE_RE.search(self.agent.message), (self.agent.message, self.agent.popup)
 
         return True
 
@@ -196,8 +203,8 @@ class Inventory:
 
     def use_container(self, container, items_to_put, items_to_take, items_to_put_counts=None,
                       items_to_take_counts=None):
-        assert container in self.items.all_items or container in self.items_below_me
-        assert all((item in self.items.all_items for item in items_to_put))
+        assert container in self.items or container in self.items_below_me
+        assert all((item in self.items for item in items_to_put))
         assert all((item in container.content.items for item in items_to_take))
         assert container.is_container()
         assert len(items_to_take) - len(items_to_put) <= self.items.free_slots()  # TODO: take counts into consideration
@@ -244,7 +251,7 @@ class Inventory:
 
         with self.agent.atom_operation():
             # TODO: refactor: the same fragment is in check_container_content
-            if container in self.items.all_items:
+            if container in self.items:
                 self.agent.step(A.Command.APPLY)
                 assert "You can't do that while carrying so much stuff." not in self.agent.message, self.agent.message
                 self.agent.step(self.items.get_letter(container), gen())
@@ -277,7 +284,7 @@ class Inventory:
 
     def check_container_content(self, item):
         assert item.is_possible_container() or item.is_container()
-        assert item in self.items.all_items or item in self.items_below_me
+        assert item in self.items or item in self.items_below_me
 
         is_bag_of_tricks = False
         if item.content is not None:
@@ -355,7 +362,7 @@ class Inventory:
 
         with self.agent.atom_operation():
             # TODO: refactor: the same fragment is in use_container
-            if item in self.items.all_items:
+            if item in self.items:
                 self.agent.step(A.Command.APPLY)
                 if "You can't do that while carrying so much stuff." in self.agent.message:
                     return  # TODO: is not changing the content in this case a good way to handle this?
@@ -387,7 +394,7 @@ class Inventory:
                 assert item.content is None
                 raise AgentPanic('bag of tricks bites')
 
-            if item in self.items.all_items and item.comment != item.container_id:
+            if item in self.items and item.comment != item.container_id:
                 self.call_item(item, item.container_id)
 
             if item.content is None:
@@ -399,6 +406,7 @@ class Inventory:
             # TODO: make it more elegant
             if len(item.glyphs) == 1 and item.glyphs[0] not in self.item_manager._is_not_bag_of_tricks:
                 self.item_manager._is_not_bag_of_tricks.add(item.glyphs[0])
+                self.item_manager._deductions_version += 1
                 self.item_manager.update_possible_objects(item)
 
     def _select_items_in_popup(self, items, counts=None):
@@ -443,7 +451,7 @@ class Inventory:
                 if not assume_appropriate_message:
                     self.agent.step(A.Command.LOOK)
                 elif 'Things that are here:' in self.agent.popup or \
-                        re.search('There are (several|many) objects here\.', self.agent.message):
+                        SEVERAL_OBJECTS_HERE_RE.search(self.agent.message):
                     # LOOK is necessary even when 'Things that are here' popup is present for some very rare cases
                     self.agent.step(A.Command.LOOK)
 
@@ -488,21 +496,19 @@ class Inventory:
                             assert 0, (self.agent.message, self.agent.popup)
                     else:
                         lines = self.agent.popup[self.agent.popup.index('Pick up what?') + 1:]
+                        position = (*self.agent.current_level().key(), self.agent.blstats.y, self.agent.blstats.x)
                         category = None
                         items = []
                         letters = []
                         for line in lines:
-                            if line in self._name_to_category:
-                                category = self._name_to_category[line]
+                            line_category = self._name_to_category.get(line)
+                            if line_category is not None:
+                                category = line_category
                                 continue
                             assert line[1:4] == ' - ', line
                             letter, line = line[0], line[4:]
                             letters.append(letter)
-                            items.append(self.item_manager.get_item_from_text(line, category,
-                                                                              position=(
-                                                                                  *self.agent.current_level().key(),
-                                                                                  self.agent.blstats.y,
-                                                                                  self.agent.blstats.x)))
+                            items.append(self.item_manager.get_item_from_text(line, category, position=position))
 
                 self.items_below_me = items
                 self.letters_below_me = letters
@@ -568,11 +574,11 @@ class Inventory:
             counts = [i.count for i in items]
         assert all(map(lambda x: isinstance(x, (int, np.int32, np.int64)), counts)), list(map(type, counts))
         assert len(items) > 0
-        assert all(map(lambda item: item in self.items.all_items, items))
+        assert all(map(lambda item: item in self.items, items))
         assert len(counts) == len(items)
         assert sum(counts) > 0 and all((0 <= c <= i.count for c, i in zip(counts, items)))
 
-        letters = [self.items.all_letters[self.items.all_items.index(item)] for item in items]
+        letters = [self.items.get_letter(item) for item in items]
         texts_to_type = [(str(count) if item.count != count else '') + letter
                          for letter, item, count in zip(letters, items, counts) if count != 0]
 
@@ -615,7 +621,7 @@ class Inventory:
         else:
             is_list = True
 
-        moved_items = {item for item in items if item in self.items.all_items}
+        moved_items = {item for item in items if item in self.items}
 
         if len(moved_items) != len(items):
             with self.agent.atom_operation():
@@ -650,7 +656,7 @@ class Inventory:
         return ret
 
     def call_item(self, item, name):
-        assert item in self.items.all_items, item
+        assert item in self.items, item
         letter = self.items.get_letter(item)
         with self.agent.atom_operation():
             self.agent.step(A.Command.CALL, iter(f'i{letter}#{name}\r'))
@@ -679,7 +685,7 @@ class Inventory:
             # TODO: eat directly from ground if possible
             item = self.move_to_inventory(item)
 
-        assert item in self.items.all_items, item or item in self.items_below_me
+        assert item in self.items, item or item in self.items_below_me
         letter = self.items.get_letter(item)
         with self.agent.atom_operation():
             if quaff:
@@ -690,7 +696,7 @@ class Inventory:
                 self.agent.step(A.Command.QUAFF, text_gen())
             else:
                 self.agent.step(A.Command.EAT)
-            if item in self.items.all_items:
+            if item in self.items:
                 while re.search('There (is|are)[a-zA-Z0-9- ]* here; eat (it|one)\?', self.agent.message):
                     self.agent.type_text('n')
                 self.agent.type_text(letter)
@@ -848,7 +854,7 @@ class Inventory:
         while 1:
             items_below_me = list(filter(lambda i: i.shop_status == Item.NOT_SHOP, flatten_items(self.items_below_me)))
             forced_items = list(filter(lambda i: not i.can_be_dropped_from_inventory(), flatten_items(self.items)))
-            assert all((item in self.items.all_items for item in forced_items))
+            assert all((item in self.items for item in forced_items))
             free_items = list(filter(lambda i: i.can_be_dropped_from_inventory(),
                                      flatten_items(sorted(self.items, key=lambda x: x.text))))
             all_items = free_items + items_below_me
@@ -856,7 +862,7 @@ class Inventory:
             item_split = self.agent.global_logic.item_priority.split(
                 all_items, forced_items, self.agent.character.carrying_capacity)
 
-            assert all((container is None or container in self.items_below_me or container in self.items.all_items or \
+            assert all((container is None or container in self.items_below_me or container in self.items or \
                         (sum(item_split[container]) == 0 and not container.content.items)
                         for container in item_split)), 'TODO: nested containers'
 
@@ -866,7 +872,7 @@ class Inventory:
             for container in item_split:
                 if container is not None:
                     counts = item_split[container]
-                    indices = [i for i, item in enumerate(all_items) if item in self.items.all_items and counts[i] > 0]
+                    indices = [i for i, item in enumerate(all_items) if item in self.items and counts[i] > 0]
                     if not indices:
                         continue
                     if not yielded:
@@ -883,7 +889,7 @@ class Inventory:
             # drop on ground
             counts = item_split[None]
             indices = [i for i, item in enumerate(free_items) if
-                       item in self.items.all_items and counts[i] != item.count]
+                       item in self.items and counts[i] != item.count]
             if indices:
                 if not yielded:
                     yielded = True
@@ -903,7 +909,7 @@ class Inventory:
                                item in container.content.items and counts[i] != item.count]
                     items_to_take_counts = [all_items[i].count - counts[i] for i in indices]
                 else:
-                    counts = np.array(list(item_split.values())).sum(0)
+                    counts = [sum(c) for c in zip(*item_split.values())]
                     indices = [i for i, item in enumerate(all_items) if
                                item in container.content.items and counts[i] != 0]
                     items_to_take_counts = [counts[i] for i in indices]
@@ -925,7 +931,7 @@ class Inventory:
                 continue
 
             # pick up from ground
-            to_pickup = np.array([counts[len(free_items):] for counts in item_split.values()]).sum(0)
+            to_pickup = [sum(c) for c in zip(*item_split.values())][len(free_items):]
             assert len(to_pickup) == len(items_below_me)
             indices = [i for i, item in enumerate(items_below_me) if to_pickup[i] > 0 and item in self.items_below_me]
             if len(indices) > 0:
@@ -1050,6 +1056,7 @@ class Inventory:
 
                 self.item_manager._glyph_to_possible_wand_types[item.glyphs[0]] = wand_types
                 self.item_manager._already_engraved_glyphs.add(item.glyphs[0])
+                self.item_manager._deductions_version += 1
                 self.item_manager.possible_objects_from_glyph(item.glyphs[0])
 
             # uncomment for debugging (stopping when there is a new wand being identified)
@@ -1281,14 +1288,12 @@ class Inventory:
         dis = self.agent.bfs()
 
         # TODO: free (no charge) items
-        mask = ~level.shop_interior & (dis > 0)
-        if not mask.any():
+        ys, xs = pickup_candidates(level.shop_interior, level.item_count, dis)
+        if not len(ys):
             yield False
 
-        mask[mask] = self.agent.current_level().item_count[mask] != 0
-
         items = {}
-        for y, x in sorted(zip(*mask.nonzero()), key=lambda p: dis[p]):
+        for y, x in zip(ys, xs):
             for i in level.items[y, x]:
                 assert i not in items
                 items[i] = (y, x)
@@ -1303,7 +1308,7 @@ class Inventory:
         item_split = self.agent.global_logic.item_priority.split(
             free_items + list(items.keys()), forced_items,
             self.agent.character.carrying_capacity)
-        counts = np.array(list(item_split.values())).sum(0)
+        counts = [sum(c) for c in zip(*item_split.values())]
 
         counts = counts[len(free_items):]
         assert len(counts) == len(items)
@@ -1,13 +1,25 @@
+import functools
+
 import nle.nethack as nh
 
 from autoascend import objects as O
 
 
+@functools.lru_cache(1024)
+def _decode_item_name(raw):
+    # rows are NUL-terminated and padded, only the part before the terminator has to be decoded
+    return raw.partition(b'\0')[0].decode()
+
+
 class InventoryItems:
     def __init__(self, agent):
         self.agent = agent
         self._previous_inv_strs = None
 
+        # (item_name, category, glyph, letter) -> item from the last rebuild, valid for the given knowledge key
+        self._items_by_row = {}
+        self._items_by_row_knowledge_key = None
+
         self._clear()
 
     def _clear(self):
@@ -24,12 +36,16 @@ class InventoryItems:
 
         self.all_items = []
         self.all_letters = []
+        self._letter_by_item_id = {}
 
         self._recheck_containers = True
 
     def __iter__(self):
         return iter(self.all_items)
 
+    def __contains__(self, item):
+        return id(item) in self._letter_by_item_id
+
     def __str__(self):
         return (
                 f'main_hand: {self.main_hand}\n'
@@ -57,16 +73,17 @@ class InventoryItems:
 
     def on_panic(self):
         self._previous_inv_strs = None
+        self._items_by_row = {}
         self._clear()
 
     def update(self, force=False):
         if force:
             self._recheck_containers = True
 
-        if force or self._previous_inv_strs is None or \
-                (self.agent.last_observation['inv_strs'] != self._previous_inv_strs).any():
+        # raw bytes comparison is a plain memcmp and also works if the observation buffer is reused
+        if force or self.agent.last_observation['inv_strs'].tobytes() != self._previous_inv_strs:
             self._clear()
-            self._previous_inv_strs = self.agent.last_observation['inv_strs']
+            self._previous_inv_strs = self.agent.last_observation['inv_strs'].tobytes()
             previous_inv_strs = self._previous_inv_strs
 
             # For some reasons sometime the inventory entries in last_observation may be duplicated
@@ -76,7 +93,7 @@ class InventoryItems:
                     self.agent.last_observation['inv_oclasses'],
                     self.agent.last_observation['inv_glyphs'],
                     self.agent.last_observation['inv_letters']):
-                item_name = bytes(item_name).decode().strip('\0')
+                item_name = _decode_item_name(item_name.tobytes())
                 letter = chr(letter)
                 if not item_name:
                     continue
@@ -86,15 +103,25 @@ class InventoryItems:
             assert len(iterable) == len(set(map(lambda x: x[-1], iterable))), \
                 'letters in inventory are not unique'
 
-            for item_name, category, glyph, letter in iterable:
-                item = self.agent.inventory.item_manager.get_item_from_text(item_name, category=category,
-                                                                            glyph=glyph if not nh.glyph_is_body(
-                                                                                glyph) and not nh.glyph_is_statue(
-                                                                                glyph) else None,
-                                                                            position=None)
+            # items of unchanged rows are reused unless something was learned that could change their parsing
+            knowledge_key = self.agent.inventory.item_manager.knowledge_key()
+            reusable_items = self._items_by_row \
+                if not force and knowledge_key == self._items_by_row_knowledge_key else {}
+            items_by_row = {}
+
+            for row in iterable:
+                item_name, category, glyph, letter = row
+                item = reusable_items.get(row)
+                if item is None:
+                    item = self.agent.inventory.item_manager.get_item_from_text(
+                        item_name, category=category,
+                        glyph=glyph if not nh.glyph_is_body(glyph) and not nh.glyph_is_statue(glyph) else None,
+                        position=None)
+                items_by_row[row] = item
 
                 self.all_items.append(item)
                 self.all_letters.append(letter)
+                self._letter_by_item_id[id(item)] = letter
 
                 if item.equipped:
                     for types, sub, name in [
@@ -115,7 +142,7 @@ class InventoryItems:
                 if item.is_possible_container() or (item.is_container() and self._recheck_containers):
                     self.agent.inventory.check_container_content(item)
 
-                if (self.agent.last_observation['inv_strs'] != previous_inv_strs).any():
+                if self.agent.last_observation['inv_strs'].tobytes() != previous_inv_strs:
                     self.update()
                     return
 
@@ -127,7 +154,10 @@ class InventoryItems:
                 # {'luckstone': 10, 'loadstone': 500, 'touchstone': 10, 'flint': 10}
 
             self._recheck_containers = False
+            self._items_by_row = items_by_row
+            # the key from before parsing: anything learned while parsing this inventory forces a re-parse next time
+            self._items_by_row_knowledge_key = knowledge_key
 
     def get_letter(self, item):
-        assert item in self.all_items, (item, self.all_items)
-        return self.all_letters[self.all_items.index(item)]
+        assert item in self, (item, self.all_items)
+        return self._letter_by_item_id[id(item)]
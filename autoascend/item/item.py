@@ -3,6 +3,16 @@ import nle.nethack as nh
 from autoascend import objects as O
 from autoascend.glyph import MON, WEA
 
+BOWS = frozenset({'bow', 'elven bow', 'orcish bow', 'yumi'})
+LAUNCHERS = BOWS | {'crossbow', 'sling'}
+ARROWS = frozenset({'arrow', 'elven arrow', 'orcish arrow', 'silver arrow', 'ya'})
+FIRED_PROJECTILES = ARROWS | {'crossbow bolt'}  # TODO: sling ammo
+# TODO: boomerang
+# TODO: aklys, Mjollnir
+THROWN_PROJECTILES = frozenset({'dagger', 'orcish dagger', 'dagger silver', 'athame dagger', 'elven dagger',
+                                'worm tooth', 'knife', 'stiletto', 'scalpel', 'crysknife',
+                                'dart', 'shuriken'})
+
 
 class Item:
     # beatitude
@@ -16,6 +26,10 @@ class Item:
     FOR_SALE = 1
     UNPAID = 2
 
+    __slots__ = ('objs', 'glyphs', 'count', 'status', 'modifier', 'equipped', 'uses', 'at_ready', 'monster_id',
+                 'shop_status', 'price', 'dmg_bonus', 'to_hit_bonus', 'naming', 'comment', 'text',
+                 'content', 'container_id', 'category')
+
     def __init__(self, objs, glyphs, count=1, status=UNKNOWN, modifier=None, equipped=False, at_ready=False,
                  monster_id=None, shop_status=NOT_SHOP, price=0, dmg_bonus=None, to_hit_bonus=None,
                  naming='', comment='', uses=None, text=None):
@@ -44,7 +58,7 @@ class Item:
         self.container_id = None  # for containers and possible containers it will be set after the constructor
 
         self.category = O.get_category(self.objs[0])
-        assert all((ord(nh.objclass(nh.glyph_to_obj(g)).oc_class) == self.category for g in self.glyphs))
+        assert all((O.object_classes[nh.glyph_to_obj(g)] == self.category for g in self.glyphs))
 
     def display_glyphs(self):
         if self.is_corpse():
@@ -127,16 +141,14 @@ class Item:
         if not self.is_weapon() or not self.is_unambiguous():
             return False
 
-        return self.object.name in ['bow', 'elven bow', 'orcish bow', 'yumi', 'crossbow', 'sling']
+        return self.object.name in LAUNCHERS
 
     def is_fired_projectile(self, launcher=None):
         if not self.is_weapon() or not self.is_unambiguous():
             return False
 
-        arrows = ['arrow', 'elven arrow', 'orcish arrow', 'silver arrow', 'ya']
-
         if launcher is None:
-            return self.object.name in (arrows + ['crossbow bolt'])  # TODO: sling ammo
+            return self.object.name in FIRED_PROJECTILES
         else:
             launcher_name = launcher.object.name
             if launcher_name == 'crossbow':
@@ -145,19 +157,14 @@ class Item:
                 # TODO: sling ammo
                 return False
             else:  # any bow
-                assert launcher_name in ['bow', 'elven bow', 'orcish bow', 'yumi'], launcher_name
-                return self.object.name in arrows
+                assert launcher_name in BOWS, launcher_name
+                return self.object.name in ARROWS
 
     def is_thrown_projectile(self):
         if not self.is_weapon() or not self.is_unambiguous():
             return False
 
-        # TODO: boomerang
-        # TODO: aklys, Mjollnir
-        return self.object.name in \
-               ['dagger', 'orcish dagger', 'dagger silver', 'athame dagger', 'elven dagger',
-                'worm tooth', 'knife', 'stiletto', 'scalpel', 'crysknife',
-                'dart', 'shuriken']
+        return self.object.name in THROWN_PROJECTILES
 
     def __str__(self):
         if self.text is not None:
@@ -165,7 +172,7 @@ class Item:
         return (f'{self.count}_'
                 f'{self.status if self.status is not None else ""}_'
                 f'{self.modifier if self.modifier is not None else ""}_'
-                f'{",".join(list(map(lambda x: x.name, self.objs)))}'
+                f'{",".join(obj.name for obj in self.objs)}'
                 )
 
     def __repr__(self):
@@ -271,7 +278,3 @@ class Item:
         if self.is_unambiguous() and self.object.name == 'bag of tricks':
             return False
         return any((isinstance(obj, O.Container) for obj in self.objs))
-
-    def content(self):
-        assert self.is_container()
-        return self.content
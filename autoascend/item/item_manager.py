@@ -1,5 +1,6 @@
 import functools
 import re
+from collections import defaultdict
 
 import nle.nethack as nh
 from nle.nethack import actions as A
@@ -10,6 +11,202 @@ from autoascend.glyph import MON
 from autoascend.item import Item
 
 
+ITEM_TEXT_RE = re.compile(
+    r'^(a|an|the|\d+)'
+    r'( empty)?'
+    r'( (cursed|uncursed|blessed))?'
+    r'( (very |thoroughly )?(rustproof|poisoned|corroded|rusty|burnt|rotted|partly eaten|partly used|diluted|unlocked|locked|wet|greased))*'
+    r'( ([+-]\d+))? '
+    r"([a-zA-z0-9-!'# ]+)"
+    r'( \(([0-9]+:[0-9]+|no charge)\))?'
+    r'( \(([a-zA-Z0-9; ]+(, flickering|, gleaming|, glimmering)?[a-zA-Z0-9; ]*)\))?'
+    r'( \((for sale|unpaid), (\d+ aum, )?((\d+)[a-zA-Z- ]+|no charge)\))?'
+    r'$'
+)
+
+# two-stage variant of ITEM_TEXT_RE: the prefix words are peeled off one by one and only the rest is matched
+ITEM_STATUSES = frozenset(['cursed', 'uncursed', 'blessed'])
+ITEM_EFFECTS = frozenset(['rustproof', 'poisoned', 'corroded', 'rusty', 'burnt', 'rotted', 'partly eaten',
+                          'partly used', 'diluted', 'unlocked', 'locked', 'wet', 'greased'])
+ITEM_MODIFIER_RE = re.compile(r'[+-]\d+')
+ITEM_NAME_AND_SUFFIXES_RE = re.compile(
+    r"([a-zA-z0-9-!'# ]+)"
+    r'( \(([0-9]+:[0-9]+|no charge)\))?'
+    r'( \(([a-zA-Z0-9; ]+(, flickering|, gleaming|, glimmering)?[a-zA-Z0-9; ]*)\))?'
+    r'( \((for sale|unpaid), (\d+ aum, )?((\d+)[a-zA-Z- ]+|no charge)\))?'
+    r'$'
+)
+
+
+def _split_item_text(text):
+    """ Returns (count, status, modifier, name, uses, info, shop_status, shop_price) strings as matched by
+    ITEM_TEXT_RE, or None if the text doesn't match """
+    words = text.split(' ')
+    count = words[0]
+    if count in ('a', 'an', 'the') or (count.isascii() and count.isdigit()):
+        i = 1
+        if words[i:i + 1] == ['empty']:
+            i += 1
+        status = ''
+        if i < len(words) and words[i] in ITEM_STATUSES:
+            status = words[i]
+            i += 1
+        while True:
+            j = i + 1 if i < len(words) and words[i] in ('very', 'thoroughly') else i
+            if j < len(words) and words[j] in ITEM_EFFECTS:
+                i = j + 1
+            elif j + 1 < len(words) and f'{words[j]} {words[j + 1]}' in ITEM_EFFECTS:
+                i = j + 2
+            else:
+                break
+        modifier = ''
+        if i < len(words) and ITEM_MODIFIER_RE.fullmatch(words[i]):
+            modifier = words[i]
+            i += 1
+        if i < len(words):
+            match = ITEM_NAME_AND_SUFFIXES_RE.match(' '.join(words[i:]))
+            if match is not None:
+                name, _, uses, _, info, _, _, shop_status, _, _, shop_price = match.groups('')
+                return count, status, modifier, name, uses, info, shop_status, shop_price
+
+    # the greedy split failed, let the full regex backtrack (e.g. for names that look like a status)
+    match = ITEM_TEXT_RE.match(text)
+    if match is None:
+        return None
+    groups = match.groups('')
+    return tuple(groups[i] for i in (0, 3, 8, 9, 11, 13, 16, 19))
+
+# alternative (e.g. Samurai) and inflected names of objects, applied in `ItemManager.parse_name`
+NAME_ALIASES = {
+    'wakizashi': 'short sword',
+    'ninja-to': 'broadsword',
+    'nunchaku': 'flail',
+    'shito': 'knife',
+    'naginata': 'glaive',
+    'gunyoki': 'food ration',
+    'osaku': 'lock pick',
+    'tanko': 'plate mail',
+    'pair of yugake': 'pair of leather gloves',
+    'yugake': 'pair of leather gloves',
+    'kabuto': 'helmet',
+    'flint stone': 'flint',
+    'flint stones': 'flint',
+    'unlabeled scroll': 'scroll of blank paper',
+    'unlabeled scrolls': 'scroll of blank paper',
+    'blank paper': 'scroll of blank paper',
+    'eucalyptus leaves': 'eucalyptus leaf',
+    'pair of lenses': 'lenses',
+    'knives': 'knife',
+}
+
+# names that determine the item status: name -> (name, status)
+STATUS_OVERRIDES = {
+    'potion of holy water': ('potion of water', Item.BLESSED),
+    'potions of holy water': ('potion of water', Item.BLESSED),
+    'potion of unholy water': ('potion of water', Item.CURSED),
+    'potions of unholy water': ('potion of water', Item.CURSED),
+    'gold piece': ('gold piece', Item.UNCURSED),
+    'gold pieces': ('gold pieces', Item.UNCURSED),
+}
+
+
+@functools.lru_cache(1)
+def _object_name_tables():
+    """ Returns a pair of dicts (name -> object ids, description -> object ids) with all the inflected forms
+    that can appear in item texts """
+    # object identified (look on names)
+    name_to_obj_ids = defaultdict(set)
+    prefixes = [
+        ('scroll of ', nh.SCROLL_CLASS),
+        ('scrolls of ', nh.SCROLL_CLASS),
+        ('spellbook of ', nh.SPBOOK_CLASS),
+        ('spellbooks of ', nh.SPBOOK_CLASS),
+        ('ring of ', nh.RING_CLASS),
+        ('rings of ', nh.RING_CLASS),
+        ('wand of ', nh.WAND_CLASS),
+        ('wands of ', nh.WAND_CLASS),
+        ('', nh.AMULET_CLASS),
+        ('potion of ', nh.POTION_CLASS),
+        ('potions of ', nh.POTION_CLASS),
+        ('', nh.GEM_CLASS),
+        ('', nh.ARMOR_CLASS),
+        ('pair of ', nh.ARMOR_CLASS),
+        ('', nh.WEAPON_CLASS),
+        ('', nh.TOOL_CLASS),
+        ('', nh.FOOD_CLASS),
+        ('', nh.COIN_CLASS),
+        ('', nh.ROCK_CLASS),
+    ]
+    suffixes = [
+        ('s', nh.GEM_CLASS),
+        ('s', nh.WEAPON_CLASS),
+        ('s', nh.TOOL_CLASS),
+        ('s', nh.FOOD_CLASS),
+        ('s', nh.COIN_CLASS),
+    ]
+    for i in range(nh.NUM_OBJECTS):
+        obj_class = O.object_classes[i]
+        obj_name = nh.objdescr.from_idx(i).oc_name
+        if not obj_name:
+            continue
+        for pref, c in prefixes:
+            if obj_class == c:
+                name_to_obj_ids[pref + obj_name].add(i)
+
+        for suf, c in suffixes:
+            if obj_class == c:
+                name_to_obj_ids[obj_name + suf].add(i)
+                if c == nh.FOOD_CLASS:
+                    name_to_obj_ids[obj_name.split()[0] + suf + ' ' + ' '.join(obj_name.split()[1:])].add(i)
+
+    # object unidentified (look on descriptions)
+    descr_to_obj_ids = defaultdict(set)
+    prefixes = [
+        ('scroll labeled ', nh.SCROLL_CLASS),
+        ('scrolls labeled ', nh.SCROLL_CLASS),
+        ('', nh.ARMOR_CLASS),
+        ('pair of ', nh.ARMOR_CLASS),
+        ('', nh.WEAPON_CLASS),
+        ('', nh.TOOL_CLASS),
+        ('', nh.FOOD_CLASS),
+        ('', nh.BALL_CLASS),
+    ]
+    suffixes = [
+        (' amulet', nh.AMULET_CLASS),
+        (' amulets', nh.AMULET_CLASS),
+        (' gem', nh.GEM_CLASS),
+        (' gems', nh.GEM_CLASS),
+        (' stone', nh.GEM_CLASS),
+        (' stones', nh.GEM_CLASS),
+        (' potion', nh.POTION_CLASS),
+        (' potions', nh.POTION_CLASS),
+        (' spellbook', nh.SPBOOK_CLASS),
+        (' spellbooks', nh.SPBOOK_CLASS),
+        (' ring', nh.RING_CLASS),
+        (' rings', nh.RING_CLASS),
+        (' wand', nh.WAND_CLASS),
+        (' wands', nh.WAND_CLASS),
+        ('s', nh.ARMOR_CLASS),
+        ('s', nh.WEAPON_CLASS),
+        ('s', nh.TOOL_CLASS),
+        ('s', nh.FOOD_CLASS),
+    ]
+    for i in range(nh.NUM_OBJECTS):
+        obj_class = O.object_classes[i]
+        obj_descr = nh.objdescr.from_idx(i).oc_descr
+        if not obj_descr:
+            continue
+        for pref, c in prefixes:
+            if obj_class == c:
+                descr_to_obj_ids[pref + obj_descr].add(i)
+
+        for suf, c in suffixes:
+            if obj_class == c:
+                descr_to_obj_ids[obj_descr + suf].add(i)
+
+    return dict(name_to_obj_ids), dict(descr_to_obj_ids)
+
+
 class ContainerContent:
     def __init__(self):
         self.reset()
@@ -45,9 +242,28 @@ class ItemManager:
         self._glyph_to_possible_wand_types = {}
         self._already_engraved_glyphs = set()
 
+        # incremented whenever any of the deductions above changes (also by Inventory)
+        self._deductions_version = 0
+
+        # glyph -> possible objects, valid for the given deductions version
+        self._possible_objects_cache = {}
+        self._possible_objects_cache_version = None
+
     def on_panic(self):
         self.update_object_glyph_mapping()
 
+    def knowledge_key(self):
+        """ Returns a value that changes whenever an item text may be parsed into a different item """
+        return self._deductions_version, self.agent.character.prop.hallu, self.agent.character.prop.blind
+
+    def _add_glyph_object_mapping(self, glyph, obj):
+        assert glyph not in self.glyph_to_object or self.glyph_to_object[glyph] == obj
+        assert obj not in self.object_to_glyph or self.object_to_glyph[obj] == glyph
+        if glyph not in self.glyph_to_object:
+            self._deductions_version += 1
+        self.glyph_to_object[glyph] = obj
+        self.object_to_glyph[obj] = glyph
+
     def update(self):
         if self._last_object_glyph_mapping_update_step is None or \
                 self._last_object_glyph_mapping_update_step + 200 < self.agent.step_count:
@@ -66,12 +282,7 @@ class ItemManager:
                     d_glyphs = O.desc_to_glyphs(desc, O.get_category(n_objs[0]))
                     assert d_glyphs
                     if len(n_objs) == 1 and len(d_glyphs) == 1:
-                        obj, glyph = n_objs[0], d_glyphs[0]
-
-                        assert glyph not in self.glyph_to_object or self.glyph_to_object[glyph] == obj
-                        self.glyph_to_object[glyph] = obj
-                        assert obj not in self.object_to_glyph or self.object_to_glyph[obj] == glyph
-                        self.object_to_glyph[obj] = glyph
+                        self._add_glyph_object_mapping(d_glyphs[0], n_objs[0])
 
             self._last_object_glyph_mapping_update_step = self.agent.step_count
 
@@ -126,6 +337,8 @@ class ItemManager:
                     low = max(low, l)
                     high = min(high, h)
                 assert low <= high, (low, high)
+                if self._glyph_to_price_range.get(item.glyphs[0]) != (low, high):
+                    self._deductions_version += 1
                 self._glyph_to_price_range[item.glyphs[0]] = (low, high)
 
                 # update mapping for that object
@@ -140,7 +353,9 @@ class ItemManager:
         self._buy_price_identification()
 
     def update_possible_objects(self, item):
-        possibilities_from_glyphs = set.union(*(set(self.possible_objects_from_glyph(glyph)) for glyph in item.glyphs))
+        possibilities_from_glyphs = set()
+        for glyph in item.glyphs:
+            possibilities_from_glyphs.update(self.possible_objects_from_glyph(glyph))
         item.objs = [o for o in item.objs if o in possibilities_from_glyphs]
         assert len(item.objs)
 
@@ -182,10 +397,7 @@ class ItemManager:
             objs = [o for o in objs if o not in self.object_to_glyph or self.object_to_glyph[o] in glyphs]
             glyphs = [g for g in glyphs if g not in self.glyph_to_object or self.glyph_to_object[g] in objs]
             if len(objs) == 1 and len(glyphs) == 1:
-                assert glyphs[0] not in self.glyph_to_object or self.glyph_to_object[glyphs[0]] == objs[0]
-                self.glyph_to_object[glyphs[0]] = objs[0]
-                assert objs[0] not in self.object_to_glyph or self.object_to_glyph[objs[0]] == glyphs[0]
-                self.object_to_glyph[objs[0]] = glyphs[0]
+                self._add_glyph_object_mapping(glyphs[0], objs[0])
             elif len(objs) == 1 and objs[0] in self.object_to_glyph:
                 glyphs = [self.object_to_glyph[objs[0]]]
             elif len(glyphs) == 1 and glyphs[0] in self.glyph_to_object:
@@ -206,6 +418,7 @@ class ItemManager:
                 item.content = self.container_contents[identifier]
                 if len(item.glyphs) == 1 and item.glyphs[0] not in self._is_not_bag_of_tricks:
                     self._is_not_bag_of_tricks.add(item.glyphs[0])
+                    self._deductions_version += 1
                     self.update_possible_objects(item)
 
         # FIXME: it gives a better score. Implement it in item equipping
@@ -221,6 +434,12 @@ class ItemManager:
         if glyph in self.glyph_to_object:
             return [self.glyph_to_object[glyph]]
 
+        if self._deductions_version != self._possible_objects_cache_version:
+            self._possible_objects_cache = {}
+            self._possible_objects_cache_version = self._deductions_version
+        elif glyph in self._possible_objects_cache:
+            return self._possible_objects_cache[glyph].copy()
+
         objs = []
         for obj in O.possibilities_from_glyph(glyph):
             if obj in self.object_to_glyph:
@@ -235,14 +454,15 @@ class ItemManager:
             objs.append(obj)
 
         if len(objs) == 1:
-            self.glyph_to_object[glyph] = objs[0]
             assert objs[0] not in self.object_to_glyph
-            self.object_to_glyph[objs[0]] = glyph
+            self._add_glyph_object_mapping(glyph, objs[0])
 
             # update objects with have the same possible glyph
             for g in O.possible_glyphs_from_object(objs[0]):
                 self.possible_objects_from_glyph(g)
         assert len(objs), (O.objects[glyph - nh.GLYPH_OBJ_OFF].desc, self._glyph_to_price_range[glyph])
+        if len(objs) > 1:
+            self._possible_objects_cache[glyph] = objs.copy()
         return objs
 
     @staticmethod
@@ -252,37 +472,14 @@ class ItemManager:
         assert glyph is None or nh.glyph_is_normal_object(glyph), glyph
 
         if category is None and glyph is not None:
-            category = ord(nh.objclass(nh.glyph_to_obj(glyph)).oc_class)
-        assert glyph is None or category is None or category == ord(nh.objclass(nh.glyph_to_obj(glyph)).oc_class)
+            category = O.object_classes[nh.glyph_to_obj(glyph)]
+        assert glyph is None or category is None or category == O.object_classes[nh.glyph_to_obj(glyph)]
 
         assert category not in [nh.RANDOM_CLASS]
 
-        matches = re.findall(
-            r'^(a|an|the|\d+)'
-            r'( empty)?'
-            r'( (cursed|uncursed|blessed))?'
-            r'( (very |thoroughly )?(rustproof|poisoned|corroded|rusty|burnt|rotted|partly eaten|partly used|diluted|unlocked|locked|wet|greased))*'
-            r'( ([+-]\d+))? '
-            r"([a-zA-z0-9-!'# ]+)"
-            r'( \(([0-9]+:[0-9]+|no charge)\))?'
-            r'( \(([a-zA-Z0-9; ]+(, flickering|, gleaming|, glimmering)?[a-zA-Z0-9; ]*)\))?'
-            r'( \((for sale|unpaid), (\d+ aum, )?((\d+)[a-zA-Z- ]+|no charge)\))?'
-            r'$',
-            text)
-        assert len(matches) <= 1, text
-        assert len(matches), (text, len(text))
-
-        (
-            count,
-            effects1,
-            _, status,
-            effects2, _, _,
-            _, modifier,
-            name,
-            _, uses,
-            _, info, _,
-            _, shop_status, _, _, shop_price
-        ) = matches[0]
+        groups = _split_item_text(text)
+        assert groups is not None, (text, len(text))
+        count, status, modifier, name, uses, info, shop_status, shop_price = groups
         # TODO: effects, uses
 
         if info in {'being worn', 'being worn; slippery', 'wielded', 'chained to you'} or info.startswith(
@@ -339,17 +536,11 @@ class ItemManager:
         else:
             assert 0, shop_status
 
-        if name in ['potion of holy water', 'potions of holy water']:
-            name = 'potion of water'
-            status = Item.BLESSED
-        elif name in ['potion of unholy water', 'potions of unholy water']:
-            name = 'potion of water'
-            status = Item.CURSED
-        elif name in ['gold piece', 'gold pieces']:
-            status = Item.UNCURSED
+        if name in STATUS_OVERRIDES:
+            name, status = STATUS_OVERRIDES[name]
 
         # TODO: pass to Item class instance
-        if name.startswith('tin of ') or name.startswith('tins of '):
+        if name.startswith(('tin of ', 'tins of ')):
             mon_name = name[len('tin of '):].strip()
             if mon_name.endswith(' meat'):
                 mon_name = mon_name[:-len(' meat')]
@@ -362,7 +553,7 @@ class ItemManager:
             else:
                 monster_id = nh.glyph_to_mon(MON.from_name(mon_name))
             name = 'tin'
-        elif name.endswith(' corpse') or name.endswith(' corpses'):
+        elif name.endswith((' corpse', ' corpses')):
             mon_name = name[:name.index('corpse')].strip()
             if mon_name.startswith('a '):
                 mon_name = mon_name[2:]
@@ -370,8 +561,7 @@ class ItemManager:
                 mon_name = mon_name[3:]
             monster_id = nh.glyph_to_mon(MON.from_name(mon_name))
             name = 'corpse'
-        elif name.startswith('statue of ') or name.startswith('statues of ') or \
-                name.startswith('historic statue of ') or name.startswith('historic statues of '):
+        elif name.startswith(('statue of ', 'statues of ', 'historic statue of ', 'historic statues of ')):
             if name.startswith('historic'):
                 mon_name = name[len('historic statue of '):].strip()
             else:
@@ -382,7 +572,7 @@ class ItemManager:
                 mon_name = mon_name[3:]
             monster_id = nh.glyph_to_mon(MON.from_name(mon_name))
             name = 'statue'
-        elif name.startswith('figurine of ') or name.startswith('figurines of '):
+        elif name.startswith(('figurine of ', 'figurines of ')):
             mon_name = name[len('figurine of '):].strip()
             if mon_name.startswith('a '):
                 mon_name = mon_name[2:]
@@ -392,7 +582,7 @@ class ItemManager:
             name = 'figurine'
         elif name in ['novel', 'paperback', 'paperback book']:
             name = 'spellbook of novel'
-        elif name.endswith(' egg') or name.endswith(' eggs'):
+        elif name.endswith((' egg', ' eggs')):
             monster_id = nh.glyph_to_mon(MON.from_name(name[:-len(' egg')].strip()))
             name = 'egg'
         elif name == 'worm teeth':
@@ -491,132 +681,17 @@ class ItemManager:
     @utils.copy_result
     @functools.lru_cache(1024 * 256)
     def parse_name(name):
-        if name == 'wakizashi':
-            name = 'short sword'
-        elif name == 'ninja-to':
-            name = 'broadsword'
-        elif name == 'nunchaku':
-            name = 'flail'
-        elif name == 'shito':
-            name = 'knife'
-        elif name == 'naginata':
-            name = 'glaive'
-        elif name == 'gunyoki':
-            name = 'food ration'
-        elif name == 'osaku':
-            name = 'lock pick'
-        elif name == 'tanko':
-            name = 'plate mail'
-        elif name in ['pair of yugake', 'yugake']:
-            name = 'pair of leather gloves'
-        elif name == 'kabuto':
-            name = 'helmet'
-        elif name in ['flint stone', 'flint stones']:
-            name = 'flint'
-        elif name in ['unlabeled scroll', 'unlabeled scrolls', 'blank paper']:
-            name = 'scroll of blank paper'
-        elif name == 'eucalyptus leaves':
-            name = 'eucalyptus leaf'
-        elif name == 'pair of lenses':
-            name = 'lenses'
+        if name in NAME_ALIASES:
+            name = NAME_ALIASES[name]
         elif name.startswith('small glob'):
             name = name[len('small '):]
-        elif name == 'knives':
-            name = 'knife'
 
+        name_to_obj_ids, descr_to_obj_ids = _object_name_tables()
         # object identified (look on names)
-        obj_ids = set()
-        prefixes = [
-            ('scroll of ', nh.SCROLL_CLASS),
-            ('scrolls of ', nh.SCROLL_CLASS),
-            ('spellbook of ', nh.SPBOOK_CLASS),
-            ('spellbooks of ', nh.SPBOOK_CLASS),
-            ('ring of ', nh.RING_CLASS),
-            ('rings of ', nh.RING_CLASS),
-            ('wand of ', nh.WAND_CLASS),
-            ('wands of ', nh.WAND_CLASS),
-            ('', nh.AMULET_CLASS),
-            ('potion of ', nh.POTION_CLASS),
-            ('potions of ', nh.POTION_CLASS),
-            ('', nh.GEM_CLASS),
-            ('', nh.ARMOR_CLASS),
-            ('pair of ', nh.ARMOR_CLASS),
-            ('', nh.WEAPON_CLASS),
-            ('', nh.TOOL_CLASS),
-            ('', nh.FOOD_CLASS),
-            ('', nh.COIN_CLASS),
-            ('', nh.ROCK_CLASS),
-        ]
-        suffixes = [
-            ('s', nh.GEM_CLASS),
-            ('s', nh.WEAPON_CLASS),
-            ('s', nh.TOOL_CLASS),
-            ('s', nh.FOOD_CLASS),
-            ('s', nh.COIN_CLASS),
-        ]
-        for i in range(nh.NUM_OBJECTS):
-            for pref, c in prefixes:
-                if ord(nh.objclass(i).oc_class) == c:
-                    obj_name = nh.objdescr.from_idx(i).oc_name
-                    if obj_name and name == pref + obj_name:
-                        obj_ids.add(i)
-
-            for suf, c in suffixes:
-                if ord(nh.objclass(i).oc_class) == c:
-                    obj_name = nh.objdescr.from_idx(i).oc_name
-                    if obj_name and (name == obj_name + suf or \
-                                     (c == nh.FOOD_CLASS and \
-                                      name == obj_name.split()[0] + suf + ' ' + ' '.join(obj_name.split()[1:]))):
-                        obj_ids.add(i)
-
+        obj_ids = name_to_obj_ids.get(name, set())
         # object unidentified (look on descriptions)
-        appearance_ids = set()
-        prefixes = [
-            ('scroll labeled ', nh.SCROLL_CLASS),
-            ('scrolls labeled ', nh.SCROLL_CLASS),
-            ('', nh.ARMOR_CLASS),
-            ('pair of ', nh.ARMOR_CLASS),
-            ('', nh.WEAPON_CLASS),
-            ('', nh.TOOL_CLASS),
-            ('', nh.FOOD_CLASS),
-            ('', nh.BALL_CLASS),
-        ]
-        suffixes = [
-            (' amulet', nh.AMULET_CLASS),
-            (' amulets', nh.AMULET_CLASS),
-            (' gem', nh.GEM_CLASS),
-            (' gems', nh.GEM_CLASS),
-            (' stone', nh.GEM_CLASS),
-            (' stones', nh.GEM_CLASS),
-            (' potion', nh.POTION_CLASS),
-            (' potions', nh.POTION_CLASS),
-            (' spellbook', nh.SPBOOK_CLASS),
-            (' spellbooks', nh.SPBOOK_CLASS),
-            (' ring', nh.RING_CLASS),
-            (' rings', nh.RING_CLASS),
-            (' wand', nh.WAND_CLASS),
-            (' wands', nh.WAND_CLASS),
-            ('s', nh.ARMOR_CLASS),
-            ('s', nh.WEAPON_CLASS),
-            ('s', nh.TOOL_CLASS),
-            ('s', nh.FOOD_CLASS),
-        ]
-
-        for i in range(nh.NUM_OBJECTS):
-            for pref, c in prefixes:
-                if ord(nh.objclass(i).oc_class) == c:
-                    obj_descr = nh.objdescr.from_idx(i).oc_descr
-                    if obj_descr and name == pref + obj_descr:
-                        appearance_ids.add(i)
-
-            for suf, c in suffixes:
-                if ord(nh.objclass(i).oc_class) == c:
-                    obj_descr = nh.objdescr.from_idx(i).oc_descr
-                    if obj_descr and name == obj_descr + suf:
-                        appearance_ids.add(i)
-
-        appearance_ids = list(appearance_ids)
-        assert len(appearance_ids) == 0 or len({ord(nh.objclass(i).oc_class) for i in appearance_ids}), name
+        appearance_ids = list(descr_to_obj_ids.get(name, ()))
+        assert len(appearance_ids) == 0 or len({O.object_classes[i] for i in appearance_ids}), name
 
         # assert (len(obj_ids) > 0) ^ (len(appearance_ids) > 0), (name, obj_ids, appearance_ids)
         if (len(obj_ids) > 0) == (len(appearance_ids) > 0):
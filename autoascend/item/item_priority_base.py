@@ -1,6 +1,3 @@
-import numpy as np
-
-
 class ItemPriorityBase:
     """
     The base class for inventory item priority logic.
@@ -28,7 +25,7 @@ class ItemPriorityBase:
     def split(self, items, forced_items, weight_capacity):
         ret = self._split(items, forced_items, weight_capacity)
         assert None in ret
-        counts = np.array(list(ret.values())).sum(0)
+        counts = [sum(c) for c in zip(*ret.values())]
         assert all((0 <= count <= item.count for count, item in zip(counts, items)))
         assert all((0 <= c <= item.count for cs in ret.values() for c, item in zip(cs, items)))
         assert all((item not in ret or item.is_container() for item in items))
@@ -0,0 +1,20 @@
+import numba as nb
+import numpy as np
+
+
+@nb.njit('Tuple((i8[:],i8[:]))(b1[:,:],i4[:,:],i4[:,:])', cache=True)
+def pickup_candidates(shop_interior, item_count, dis):
+    """ Reachable positions with items outside of shops, sorted by distance (row-major for equal distances) """
+    ys = np.empty(dis.size, np.int64)
+    xs = np.empty(dis.size, np.int64)
+    ds = np.empty(dis.size, np.int32)
+    n = 0
+    for y in range(dis.shape[0]):
+        for x in range(dis.shape[1]):
+            if dis[y, x] > 0 and item_count[y, x] != 0 and not shop_interior[y, x]:
+                ys[n] = y
+                xs[n] = x
+                ds[n] = dis[y, x]
+                n += 1
+    order = np.argsort(ds[:n], kind='mergesort')
+    return ys[:n][order], xs[:n][order]
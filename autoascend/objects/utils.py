@@ -3,6 +3,9 @@ import functools
 from .data import *
 from .. import utils
 
+# object id -> object class, i.e. `ord(nh.objclass(i).oc_class)`
+object_classes = [ord(nh.objclass(i).oc_class) for i in range(nh.NUM_OBJECTS)]
+
 
 @utils.copy_result
 @functools.lru_cache(len(objects))
@@ -10,7 +13,7 @@ def possibilities_from_glyph(i):
     assert nh.glyph_is_object(i)
     obj_id = nh.glyph_to_obj(i)
     desc = nh.objdescr.from_idx(obj_id).oc_descr or nh.objdescr.from_idx(obj_id).oc_name
-    cat = ord(nh.objclass(obj_id).oc_class)
+    cat = object_classes[obj_id]
 
     if cat == nh.WEAPON_CLASS:
         if desc == 'runed broadsword':
@@ -41,7 +44,7 @@ def possibilities_from_glyph(i):
         return ret
 
     if cat in [nh.TOOL_CLASS, nh.FOOD_CLASS]:
-        return [o for i, o in enumerate(objects) if o is not None and ord(nh.objclass(i).oc_class) == cat and \
+        return [o for i, o in enumerate(objects) if o is not None and object_classes[i] == cat and \
                 (o.desc or o.name) == desc]
 
     if cat == nh.GEM_CLASS:
@@ -121,7 +124,7 @@ def possible_glyphs_from_object(obj):
 def desc_to_glyphs(desc, category=None):
     assert desc is not None
     ret = [i + nh.GLYPH_OBJ_OFF for i, o in enumerate(objects)
-           if o is not None and ord(nh.objclass(i).oc_class) == category and o.desc == desc]
+           if o is not None and object_classes[i] == category and o.desc == desc]
     assert ret
     return ret
 
@@ -131,7 +134,7 @@ def from_name(name, category=None):
     ret = []
     for i, o in enumerate(objects):
         if o is not None and o.name == name and \
-                (category is None or ord(nh.objclass(i).oc_class) == category):
+                (category is None or object_classes[i] == category):
             ret.append(o)
 
     assert len(ret) == 1, (name, category, ret)
@@ -140,4 +143,4 @@ def from_name(name, category=None):
 
 @functools.lru_cache(len(objects))
 def get_category(obj):
-    return ord(nh.objclass(objects.index(obj)).oc_class)
+    return object_classes[objects.index(obj)]
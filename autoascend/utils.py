@@ -13,7 +13,7 @@ import toolz
 from .strategy import Strategy
 
 
-@nb.njit(cache=True)
+@nb.njit('i4[:,:](i8,i8,b1[:,:],b1[:,:],b1)', cache=True)
 def bfs(y, x, *, walkable, walkable_diagonally, can_squeeze):
     dis = np.zeros(walkable.shape, dtype=np.int32)
     dis[:] = -1
@@ -84,6 +84,21 @@ class DrawTilesScope():
         self.visualizer.drawers.remove(self.fun_instance)
 
 
+class OverlaysScope():
+
+    def __init__(self, visualizer, scopes):
+        self.visualizer = visualizer
+        self.scopes = scopes
+
+    def __enter__(self):
+        self.fun_instances = [scope.draw_fun for scope in self.scopes]
+        self.visualizer.drawers.extend(self.fun_instances)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for fun_instance in self.fun_instances:
+            self.visualizer.drawers.remove(fun_instance)
+
+
 class DebugLogScope():
 
     def __init__(self, visualizer, txt, color):
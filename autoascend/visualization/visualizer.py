@@ -8,7 +8,7 @@ import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
 # avoid importing agent modules here, because it makes agent reloading less reliable
-from .scopes import DrawTilesScope, DebugLogScope
+from .scopes import DrawTilesScope, DebugLogScope, OverlaysScope
 from .utils import put_text, draw_frame, draw_grid, FONT_SIZE, VideoWriter
 
 HISTORY_SIZE = 13
@@ -93,6 +93,10 @@ class Visualizer:
     def debug_tiles(self, *args, **kwargs):
         return DrawTilesScope(self, *args, **kwargs)
 
+    def with_overlays(self, scopes):
+        # installs a list of `DrawTilesScope` at once
+        return OverlaysScope(self, scopes)
+
     def debug_log(self, txt, color):
         return DebugLogScope(self, txt, color)
 
@@ -133,6 +137,22 @@ class Visualizer:
 
         return True
 
+    def will_render_now(self):
+        # whether the next `render` call will produce a frame (mirrors `_render` checks, without side effects)
+        if self.video_writer is not None or self.last_obs is None:
+            return False
+        if self.start_visualize is not None and self.env.step_count < self.start_visualize:
+            return False
+        if self._force_next_frame:
+            return True
+        if self.frame_skipping is not None:
+            return (self.frame_counter + 1) % self.frame_skipping == 0
+        return self.frame_counter + 1 > self._dynamic_frame_skipping()
+
+    def _dynamic_frame_skipping(self):
+        return self._dynamic_frame_skipping_render_time / self._dynamic_frame_skipping_agent_time / \
+               self._dynamic_frame_skipping_threshold
+
     def _render(self):
         if not self._force_next_frame and self.frame_skipping is not None:
             # static frame skipping
@@ -141,9 +161,7 @@ class Visualizer:
 
         if self.frame_skipping is None:
             # dynamic frame skipping
-            frame_skipping = self._dynamic_frame_skipping_render_time / self._dynamic_frame_skipping_agent_time / \
-                             self._dynamic_frame_skipping_threshold
-            if not self._force_next_frame and self.frame_counter <= frame_skipping:
+            if not self._force_next_frame and self.frame_counter <= self._dynamic_frame_skipping():
                 return None
             else:
                 self.frame_counter = 0
@@ -1,14 +1,20 @@
+import contextlib
+import gc
 import json
 import multiprocessing
 import os
+import queue
+import signal
 import subprocess
 import sys
 import termios
+import threading
 import time
 import traceback
 import tty
 import warnings
 from argparse import ArgumentParser
+from collections import Counter
 from multiprocessing import Process, Queue
 from multiprocessing.pool import ThreadPool
 from pathlib import Path
@@ -23,20 +29,25 @@ from autoascend.env_wrapper import EnvWrapper
 from autoascend.utils import plot_dashboard
 
 
+rng = np.random.default_rng()
+
+RESULTS_JSON_REWRITE_PERIOD = 20  # episodes
+
+
 def prepare_env(args, seed):
     seed += args.seed
 
+    nle_env = gym.make('NetHackChallenge-v0', no_progress_timeout=1000)
     if args.role:
+        # the same environment is reseeded until the character has one of the requested roles
         while 1:
-            env = gym.make('NetHackChallenge-v0')
-            env.seed(seed, seed)
-            obs = env.reset()
+            nle_env.seed(seed, seed)
+            obs = nle_env.reset()
             blstats = agent_lib.BLStats(*obs['blstats'])
             character_glyph = obs['glyphs'][blstats.y, blstats.x]
             if any([nh.permonst(nh.glyph_to_mon(character_glyph)).mname.startswith(role) for role in args.role]):
                 break
             seed += 10 ** 9
-            env.close()
 
     if args.visualize_ends is not None:
         assert args.mode == 'simulate'
@@ -50,30 +61,60 @@ def prepare_env(args, seed):
                            frame_skipping=None if not visualize_with_simulate else 1,
                            output_video_path=(args.output_video_dir / f'{seed}.mp4'
                                               if args.output_video_dir is not None else None))
-    env = EnvWrapper(gym.make('NetHackChallenge-v0', no_progress_timeout=1000),
+    env = EnvWrapper(nle_env,
                      to_skip=args.skip_to, visualizer_args=visualizer_args,
                      agent_args=dict(panic_on_errors=args.panic_on_errors,
                                      verbose=args.mode == 'run'),
                      interactive=args.mode == 'run')
     env.env.seed(seed, seed)
+
+    # long-lived objects (nle, agent modules, visualizer) don't need to be rescanned by every collection
+    gc.collect()
+    gc.freeze()
     return env
 
 
+class SimulationTimeout(KeyboardInterrupt):
+    # it inherits from KeyboardInterrupt as the agent doesn't catch that exception
+    pass
+
+
+@contextlib.contextmanager
+def _alarm(timeout):
+    def handler(signum, frame):
+        raise SimulationTimeout()
+
+    old_handler = signal.signal(signal.SIGALRM, handler)
+    # repeated every second, as the exception may be swallowed by a bare except in the agent
+    signal.setitimer(signal.ITIMER_REAL, timeout, 1)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, old_handler)
+
+
 def single_simulation(args, seed_offset, timeout=720):
     start_time = time.time()
     env = prepare_env(args, seed_offset)
 
     try:
-        if timeout is not None:
+        if timeout is None:
+            env.main()
+        elif hasattr(signal, 'SIGALRM') and threading.current_thread() is threading.main_thread():
+            with _alarm(timeout):
+                env.main()
+        else:
             with ThreadPool(1) as pool:
                 pool.apply_async(env.main).get(timeout)
-        else:
-            env.main()
-    except multiprocessing.context.TimeoutError:
+    except (SimulationTimeout, multiprocessing.context.TimeoutError):
         env.end_reason = f'timeout'
     except BaseException as e:
         env.end_reason = f'exception: {"".join(traceback.format_exception(None, e, e.__traceback__))}'
         print(f'Seed {env.env.get_seeds()}, step {env.step_count}:', env.end_reason)
+    finally:
+        # don't leak the frozen set to the next episodes simulated in this process
+        gc.unfreeze()
 
     end_time = time.time()
     summary = env.get_summary()
@@ -99,66 +140,54 @@ def run_single_interactive_game(args):
         os.system('stty sane')
 
 
-def run_profiling(args):
-    if args.profiler == 'cProfile':
-        import cProfile, pstats
-    elif args.profiler == 'pyinstrument':
-        from pyinstrument import Profiler
-    elif args.profiler == 'none':
+class _NullProfiler:
+    def start(self):
         pass
-    else:
-        assert 0
 
-    if args.profiler == 'cProfile':
-        pr = cProfile.Profile()
-    elif args.profiler == 'pyinstrument':
-        profiler = Profiler()
-    elif args.profiler == 'none':
+    def stop(self):
         pass
-    else:
-        assert 0
 
-    if args.profiler == 'cProfile':
-        pr.enable()
-    elif args.profiler == 'pyinstrument':
-        profiler.start()
-    elif args.profiler == 'none':
+    def report(self):
         pass
-    else:
-        assert 0
 
-    start_time = time.time()
-    res = []
-    for i in range(args.episodes):
-        print(f'starting {i + 1} game...')
-        res.append(single_simulation(args, i, timeout=None))
-    duration = time.time() - start_time
 
-    if args.profiler == 'cProfile':
-        pr.disable()
-    elif args.profiler == 'pyinstrument':
-        session = profiler.stop()
-    elif args.profiler == 'none':
-        pass
-    else:
-        assert 0
+class _CProfileProfiler:
+    def __init__(self):
+        import cProfile
+        self.pr = cProfile.Profile()
 
-    print()
-    print('turns_per_second :', sum([r['turns'] for r in res]) / duration)
-    print('steps_per_second :', sum([r['steps'] for r in res]) / duration)
-    print('episodes_per_hour:', len(res) / duration * 3600)
-    print()
+    def start(self):
+        self.pr.enable()
 
-    if args.profiler == 'cProfile':
-        stats = pstats.Stats(pr).sort_stats(pstats.SortKey.CUMULATIVE)
+    def stop(self):
+        self.pr.disable()
+
+    def report(self):
+        import pstats
+        stats = pstats.Stats(self.pr).sort_stats(pstats.SortKey.CUMULATIVE)
         stats.print_stats(30)
-        stats = pstats.Stats(pr).sort_stats(pstats.SortKey.TIME)
+        stats = pstats.Stats(self.pr).sort_stats(pstats.SortKey.TIME)
         stats.print_stats(30)
         stats.dump_stats('/tmp/nethack_stats.profile')
 
         subprocess.run('gprof2dot -f pstats /tmp/nethack_stats.profile -o /tmp/calling_graph.dot'.split())
         subprocess.run('xdot /tmp/calling_graph.dot'.split())
-    elif args.profiler == 'pyinstrument':
+
+
+class _PyinstrumentProfiler:
+    def __init__(self):
+        from pyinstrument import Profiler
+        self.profiler = Profiler()
+        self.session = None
+
+    def start(self):
+        self.profiler.start()
+
+    def stop(self):
+        self.session = self.profiler.stop()
+
+    def report(self):
+        profiler, session = self.profiler, self.session
         frame_records = session.frame_records
 
         new_records = []
@@ -196,10 +225,132 @@ def run_profiling(args):
         print('Total time:')
         profiler._last_session = session
         print(profiler.output_text(unicode=True, color=True, show_all=True))
-    elif args.profiler == 'none':
-        pass
-    else:
-        assert 0
+
+
+PROFILERS = {
+    'cProfile': _CProfileProfiler,
+    'pyinstrument': _PyinstrumentProfiler,
+    'none': _NullProfiler,
+}
+
+
+def run_profiling(args):
+    profiler = PROFILERS[args.profiler]()
+    profiler.start()
+
+    start_time = time.time()
+    res = []
+    for i in range(args.episodes):
+        print(f'starting {i + 1} game...')
+        res.append(single_simulation(args, i, timeout=None))
+    duration = time.time() - start_time
+
+    profiler.stop()
+
+    print()
+    print('turns_per_second :', sum([r['turns'] for r in res]) / duration)
+    print('steps_per_second :', sum([r['steps'] for r in res]) / duration)
+    print('episodes_per_hour:', len(res) / duration * 3600)
+    print()
+
+    profiler.report()
+
+
+def _load_results(path):
+    with path.open('r') as f:
+        all_res = json.load(f)
+
+    # the jsonl file (one line per episode) is more up to date if the previous run was interrupted.
+    # It's used only when it extends the json, so an edited json isn't overridden by stale lines
+    jsonl_path = path.with_suffix('.jsonl')
+    if not jsonl_path.exists():
+        return all_res
+    jsonl_res = {}
+    with jsonl_path.open('r') as f:
+        for line in f:
+            try:
+                single_res = json.loads(line)
+            except json.JSONDecodeError:  # truncated last line
+                break
+            if not jsonl_res:
+                jsonl_res = {key: [] for key in single_res}
+            for k, v in single_res.items():
+                jsonl_res[k].append(v)
+    if jsonl_res and len(jsonl_res['seed']) >= len(all_res.get('seed', [])):
+        return jsonl_res
+    return all_res
+
+
+def _write_results(path, all_res):
+    with path.open('w') as f:
+        json.dump(all_res, f)
+    with path.with_suffix('.jsonl').open('w') as f:
+        for values in zip(*all_res.values()):
+            f.write(json.dumps(dict(zip(all_res.keys(), values))) + '\n')
+
+
+def _append_result(path, single_res):
+    with path.with_suffix('.jsonl').open('a') as f:
+        f.write(json.dumps(single_res) + '\n')
+
+
+def _count_end_reasons(end_reasons, counter):
+    for r in end_reasons:
+        counter['exceptions'] += r.startswith('exception:')
+        counter['steplimit'] += r.startswith('steplimit') or r.startswith('ABORT')
+        counter['timeout'] += r.startswith('timeout')
+
+
+class SimulationWorker:
+    """ Ray actor that plays episodes in a child process, replaced every `episodes_per_process` episodes.
+    A crash of nle kills only the child, not the actor """
+
+    def __init__(self, episodes_per_process):
+        self.episodes_per_process = episodes_per_process
+        self.process = None
+        self.task_queue = None
+        self.result_queue = None
+        self.episodes = 0
+
+    @staticmethod
+    def _loop(task_queue, result_queue, parent_pid):
+        while 1:
+            try:
+                task = task_queue.get(timeout=1)
+            except queue.Empty:
+                if os.getppid() != parent_pid:  # the actor was killed
+                    return
+                continue
+            result_queue.put(single_simulation(*task))
+
+    def _stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    def simulate(self, args, seed_offset, timeout):
+        if self.process is not None and (self.episodes >= self.episodes_per_process or not self.process.is_alive()):
+            self._stop()
+        if self.process is None:
+            self.task_queue, self.result_queue = Queue(), Queue()
+            self.process = Process(target=self._loop, args=(self.task_queue, self.result_queue, os.getpid()),
+                                   daemon=True)
+            self.process.start()
+            self.episodes = 0
+
+        self.episodes += 1
+        self.task_queue.put((args, seed_offset, timeout))
+        try:
+            while 1:
+                try:
+                    return self.result_queue.get(timeout=1)
+                except queue.Empty:
+                    if not self.process.is_alive():
+                        raise RuntimeError(f'simulation worker died (exitcode {self.process.exitcode})')
+        except BaseException:
+            self._stop()
+            raise
 
 
 def run_simulations(args):
@@ -218,18 +369,22 @@ def run_simulations(args):
 
         fig = plt.figure()
         plt.show(block=False)
+        # the queue carries only new results (dicts of columns), they're accumulated here
+        res = {}
         while 1:
-            res = None
+            is_updated = False
             try:
                 while 1:
-                    res = plot_queue.get(block=False)
+                    for k, v in plot_queue.get(block=False).items():
+                        res.setdefault(k, []).extend(v)
+                    is_updated = True
             except:
                 plt.pause(0.5)
-                if res is None:
+                if not is_updated:
                     continue
 
             fig.clear()
-            plot_dashboard(fig, res)
+            plot_dashboard(fig, dict(res))
             fig.tight_layout()
             plt.show(block=False)
 
@@ -271,12 +426,30 @@ def run_simulations(args):
         # p.join(timeout=timeout + 1)
         # assert not q.empty()
 
+    workers = []
+    if args.episodes_per_worker > 1:
+        # opt-in, as episodes played by the same process share module-level caches (and nle state),
+        # so the result of a seed may depend on the seeds played before it by that process
+        num_workers = int(ray.cluster_resources().get('CPU', 1))
+        if args.with_gpu:
+            num_workers = max(1, min(num_workers, int(ray.cluster_resources().get('GPU', 0) * 4)))
+        worker_cls = ray.remote(SimulationWorker).options(num_cpus=1, num_gpus=1 / 4 if args.with_gpu else 0)
+        workers = [worker_cls.remote(args.episodes_per_worker) for _ in range(num_workers)]
+
+    def submit_simulation(seed_offset):
+        if not workers:
+            return remote_simulation.remote(args, seed_offset)
+        timeout = 500 if args.output_video_dir is None else 4 * 24 * 60 * 60
+        return workers[len(refs) % len(workers)].simulate.remote(args, seed_offset, timeout)
+
     try:
-        with args.simulation_results.open('r') as f:
-            all_res = json.load(f)
+        all_res = _load_results(args.simulation_results)
         print('Continue running: ', (len(all_res['seed'])))
     except FileNotFoundError:
         all_res = {}
+        if args.visualize_ends is None:
+            # a fresh run, don't append to the lines of some previous one
+            args.simulation_results.with_suffix('.jsonl').unlink(missing_ok=True)
 
     done_seeds = set()
     if 'seed' in all_res:
@@ -293,6 +466,16 @@ def run_simulations(args):
         for k, v in all_res.items():
             all_res[k] = [v for i, v in enumerate(v) if i not in idx_to_repeat]
 
+    if all_res and args.visualize_ends is None:
+        _write_results(args.simulation_results, all_res)
+
+    if all_res and not args.no_plot:
+        # copy, as the queue pickles the object lazily (in a feeder thread) and `all_res` is appended below
+        plot_queue.put({k: list(v) for k, v in all_res.items()})
+
+    end_reason_counter = Counter()
+    _count_end_reasons(all_res.get('end_reason', []), end_reason_counter)
+
     print('skipping seeds', done_seeds)
     for seed_offset in range(args.episodes):
         seed = args.seed + seed_offset
@@ -301,10 +484,11 @@ def run_simulations(args):
         if args.seeds and seed not in args.seeds:
             continue
         if args.visualize_ends is None or seed_offset in [k % 10 ** 9 for k in args.visualize_ends]:
-            refs.append(remote_simulation.remote(args, seed_offset))
+            refs.append(submit_simulation(seed_offset))
 
     count = len(done_seeds)
     initial_count = count
+    median_score_std = None
     for handle in refs:
         ref, refs = ray.wait(refs, num_returns=1, timeout=None)
         single_res = ray.get(ref[0])
@@ -314,16 +498,20 @@ def run_simulations(args):
         assert all_res.keys() == single_res.keys()
 
         count += 1
+        single_res = {k: v if not hasattr(v, 'item') else v.item() for k, v in single_res.items()}
         for k, v in single_res.items():
-            all_res[k].append(v if not hasattr(v, 'item') else v.item())
+            all_res[k].append(v)
+        _count_end_reasons([single_res['end_reason']], end_reason_counter)
 
-        plot_queue.put(all_res)
+        if not args.no_plot:
+            plot_queue.put({k: [v] for k, v in single_res.items()})
 
         total_duration = time.time() - start_time
 
-        median_score_std = np.std([np.median(np.random.choice(all_res["score"],
-                                                              size=max(1, len(all_res["score"]) // 2)))
-                                   for _ in range(1024)])
+        # bootstrap estimate, refreshed only every few episodes
+        if median_score_std is None or count % 5 == 0 or not refs:
+            samples = rng.choice(all_res['score'], size=(1024, max(1, len(all_res['score']) // 2)))
+            median_score_std = np.median(samples, axis=1).std()
 
         text = []
         text.append(f'count                         : {count}')
@@ -343,17 +531,20 @@ def run_simulations(args):
                     f'{np.quantile(all_res["score"], 0.95)}')
         text.append(f'score_25-75                   : {np.quantile(all_res["score"], 0.25)} '
                     f'{np.quantile(all_res["score"], 0.75)}')
-        text.append(f'exceptions                    : '
-                    f'{sum([r.startswith("exception:") for r in all_res["end_reason"]])}')
-        text.append(f'steplimit                     : '
-                    f'{sum([r.startswith("steplimit") or r.startswith("ABORT") for r in all_res["end_reason"]])}')
-        text.append(f'timeout                       : '
-                    f'{sum([r.startswith("timeout") for r in all_res["end_reason"]])}')
+        text.append(f'exceptions                    : {end_reason_counter["exceptions"]}')
+        text.append(f'steplimit                     : {end_reason_counter["steplimit"]}')
+        text.append(f'timeout                       : {end_reason_counter["timeout"]}')
         print('\n'.join(text) + '\n')
 
         if args.visualize_ends is None:
-            with args.simulation_results.open('w') as f:
-                json.dump(all_res, f)
+            if count == initial_count + 1 or count % RESULTS_JSON_REWRITE_PERIOD == 0:
+                # the json is kept reasonably fresh for its consumers (and for resuming) if the run is interrupted
+                _write_results(args.simulation_results, all_res)
+            else:
+                _append_result(args.simulation_results, single_res)
+
+    if all_res and args.visualize_ends is None:
+        _write_results(args.simulation_results, all_res)
 
     print('DONE!')
     ray.shutdown()
@@ -381,6 +572,10 @@ def parse_args():
                         help="Episode visualization video directory -- valid only with 'simulate' mode")
     parser.add_argument('--profiler', choices=('cProfile', 'pyinstrument', 'none'), default='pyinstrument')
     parser.add_argument('--with-gpu', action='store_true')
+    parser.add_argument('--episodes-per-worker', type=int, default=1,
+                        help='Number of episodes played by one simulation process before it is replaced. '
+                             'Values above 1 save the process startup, but the results of seeds are no longer '
+                             'independent of the seeds played before them (only relevant in simulate mode)')
     parser.add_argument('--simulation-results', default='nh_sim.json', type=Path,
                         help='path to simulation results json. Only for simulation mode')
 